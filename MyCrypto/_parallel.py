@@ -0,0 +1,62 @@
+# Process pool shared by the bulk mode engines.
+# Work is cut into independent shards, each one is sent
+# 	to a worker together with the (picklable) cipher.
+#
+# The pool is opt-in: set WORKERS to the number of processes
+# 	(None for cpu_count()). Under the spawn start method (the default
+# 	on Windows and macOS) the workers import __main__ again, so the
+# 	script needs an `if __name__ == '__main__'` guard. If the pool
+# 	breaks anyway, the work is done serially.
+
+from os import cpu_count
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Below this many bytes the pool costs more than it saves
+THRESHOLD = 1 << 20
+
+# 1 disables the pool, None means cpu_count()
+WORKERS = 1
+
+_executor = None
+
+def workers() :
+	return WORKERS or cpu_count() or 1
+
+def executor() :
+	# A new pool whenever the number of workers has changed
+	global _executor
+	n = workers()
+	if _executor is not None and _executor._max_workers != n :
+		shutdown()
+	if _executor is None :
+		_executor = ProcessPoolExecutor(n)
+	return _executor
+
+def shutdown() :
+	global _executor
+	if _executor is not None :
+		_executor.shutdown(wait=True)
+		_executor = None
+
+def shards(size, align=1) :
+	# Cut [0, size) into at most workers() pieces,
+	# 	every bound except the last is a multiple of align
+	n = workers()
+	step = -(-size // n) # ceil
+	step += -step % align
+	return [(i, min(i + step, size)) for i in range(0, size, step or 1)]
+
+def enabled(size) :
+	return size >= THRESHOLD and workers() > 1
+
+def pmap(func, *iterables) :
+	# -> the list of results, in order
+	args = list(zip(*iterables))
+	try :
+		return list(executor().map(func, *zip(*args)))
+	except BrokenProcessPool :
+		# e.g. a worker could not start, the pool is dropped
+		global _executor
+		_executor = None
+		return [func(*i) for i in args]
@@ -6,7 +6,15 @@
 
 from .base import BlockCipher
 from array import array
+from itertools import chain, islice
 from struct import unpack, pack
+from sys import byteorder
+
+# Optional: a vectorized backend for bulk data
+try :
+	import numpy as np
+except ImportError :
+	np = None
 
 rcon = bytes((0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1b, 0x36))
 
@@ -109,97 +117,210 @@ U2 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, U1))
 U3 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, U2))
 U4 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, U3))
 
+# The last round has no MixColumns, just SubBytes moved to its byte lane
+FS1 = array('I', (i << 24 for i in SBox))
+FS2 = array('I', (i << 16 for i in SBox))
+FS3 = array('I', (i <<  8 for i in SBox))
+FS4 = array('I', (i       for i in SBox))
+
+FD1 = array('I', (i << 24 for i in InvSBox))
+FD2 = array('I', (i << 16 for i in InvSBox))
+FD3 = array('I', (i <<  8 for i in InvSBox))
+FD4 = array('I', (i       for i in InvSBox))
+
+def _kernel(Nr, inverse=False, single=False) :
+	# Build a multi-block kernel with all the Nr rounds unrolled,
+	# 	the state and round keys only live in local integers.
+	# single: a kernel for exactly one block, without the array
+	# 	round trip, for the block-by-block modes
+	# InvShiftRows takes the columns the other way round
+	T, F, shift = ('TD', 'FD', (0, 3, 2, 1)) if inverse else ('TE', 'FS', (0, 1, 2, 3))
+	
+	def column(s, i, r, T) :
+		return ('{T}1[{s}{0} >> 24] ^ {T}2[{s}{1} >> 16 & 255] ^ '
+			'{T}3[{s}{2} >> 8 & 255] ^ {T}4[{s}{3} & 255] ^ k{k}').format(
+				*(i+j & 3 for j in shift), s=s, T=T, k=4*r+i)
+	
+	src = [
+		'def kernel(data, K, swap=byteorder == "little", unpack=unpack, pack=pack,',
+		'	{0}1={0}1, {0}2={0}2, {0}3={0}3, {0}4={0}4,'.format(T),
+		'	{0}1={0}1, {0}2={0}2, {0}3={0}3, {0}4={0}4) :'.format(F),
+		'	{} = K'.format(', '.join('k%d' % i for i in range(4*Nr+4))),
+	]
+	if single :
+		src.append('	s0, s1, s2, s3 = unpack(">IIII", data)')
+	else :
+		src.extend((
+			'	w = array("I")',
+			'	w.frombytes(data)',
+			'	if swap : w.byteswap()',
+			'	out = []',
+			'	it = iter(w)',
+			'	for s0, s1, s2, s3 in zip(it, it, it, it) :',
+		))
+	indent = '\t' if single else '\t\t'
+	src.append(indent + 's0 ^= k0; s1 ^= k1; s2 ^= k2; s3 ^= k3')
+	for r in range(1, Nr) :
+		s, d = 'st' if r & 1 else 'ts'
+		src.extend(indent + '{}{} = {}'.format(d, i, column(s, i, r, T)) for i in range(4))
+	src.append(indent + ('return pack(">IIII",' if single else 'out += ('))
+	src.extend(indent + '	{},'.format(column('ts'[Nr & 1], i, Nr, F)) for i in range(4))
+	src.append(indent + ')')
+	if not single :
+		src.extend((
+			'	w = array("I", out)',
+			'	if swap : w.byteswap()',
+			'	return w.tobytes()',
+		))
+	
+	namespace = dict(globals())
+	exec('\n'.join(src), namespace)
+	return namespace['kernel']
+
+ENCRYPT_BLOCKS = {Nr: _kernel(Nr) for Nr in (10, 12, 14)}
+DECRYPT_BLOCKS = {Nr: _kernel(Nr, True) for Nr in (10, 12, 14)}
+ENCRYPT_BLOCK = {Nr: _kernel(Nr, single=True) for Nr in (10, 12, 14)}
+DECRYPT_BLOCK = {Nr: _kernel(Nr, True, True) for Nr in (10, 12, 14)}
+
+# From this many bytes on, the NumPy backend is used (if installed)
+NUMPY_THRESHOLD = 1 << 12
+
+if np is not None :
+	NTE = tuple(np.array(i, dtype=np.uint32) for i in (TE1, TE2, TE3, TE4))
+	NTD = tuple(np.array(i, dtype=np.uint32) for i in (TD1, TD2, TD3, TD4))
+	NFS = tuple(np.array(i, dtype=np.uint32) for i in (FS1, FS2, FS3, FS4))
+	NFD = tuple(np.array(i, dtype=np.uint32) for i in (FD1, FD2, FD3, FD4))
+
+def _numpy_blocks(data, K, inverse=False) :
+	# The state of all blocks is kept as four uint32 column vectors,
+	# 	every round is 16 gathers and xors over all of them at once
+	(T1, T2, T3, T4), (F1, F2, F3, F4), shift = (
+		(NTD, NFD, (0, 3, 2, 1)) if inverse else (NTE, NFS, (0, 1, 2, 3)))
+	K = np.array(K, dtype=np.uint32).reshape(-1, 4)
+	
+	s = np.frombuffer(data, dtype='>u4').reshape(-1, 4).astype(np.uint32)
+	s = [s[:, i] ^ K[0, i] for i in range(4)]
+	for r in range(1, len(K) - 1) :
+		s = [
+			T1[s[i] >> 24] ^ T2[s[i+shift[1] & 3] >> 16 & 255] ^
+			T3[s[i+shift[2] & 3] >> 8 & 255] ^ T4[s[i+shift[3] & 3] & 255] ^ K[r, i]
+			for i in range(4)
+		]
+	
+	out = np.empty((len(s[0]), 4), dtype='>u4')
+	for i in range(4) :
+		out[:, i] = (
+			F1[s[i] >> 24] ^ F2[s[i+shift[1] & 3] >> 16 & 255] ^
+			F3[s[i+shift[2] & 3] >> 8 & 255] ^ F4[s[i+shift[3] & 3] & 255] ^ K[-1, i])
+	return out.tobytes()
+
+def expand_key(key) :
+	# for AES, Nb = 4
+	Nk = len(key) >> 2 # 4, 6, 8
+	Nr = Nk + 6
+	
+	w = array('I', unpack('>'+'I'*Nk, key)+(0,)*4*Nr)
+	
+	for i in range(Nk, 4*Nr+4) :
+		temp = w[i-1]
+		if not (i % Nk) :
+			# RotWord -> i32 <<< 8
+			temp = (temp & 0xffffff)<<8 | temp>>24
+			
+			# SubWord -> SBOX: 32 bit -> 32 bit
+			temp = ((
+				SBox[temp >> 24       ] ^ rcon[i//Nk-1]) << 24 |
+				SBox[temp >> 16 & 0xff]                  << 16 |
+				SBox[temp >>  8 & 0xff]                  <<  8 |
+				SBox[temp       & 0xff]
+			)
+		elif Nk > 6 and i % Nk == 4 :
+			# SubWord -> SBOX: 32 bit -> 32 bit
+			temp = (
+				SBox[temp >> 24       ] << 24 |
+				SBox[temp >> 16 & 0xff] << 16 |
+				SBox[temp >>  8 & 0xff] <<  8 |
+				SBox[temp       & 0xff]
+			)
+		w[i] = w[i-Nk] ^ temp
+		
+	return tuple(w[i:i+4] for i in range(0, 4*Nr+4, 4))
+	
+def inverse_key(K) :
+	# The decryption schedule: reversed, with InvMixColumns
+	# 	applied to all but the first and the last round keys
+	iK = [K[-1]]
+	iK.extend(array('I', (
+		U1[j >> 24       ] ^
+		U2[j >> 16 & 0xff] ^
+		U3[j >>  8 & 0xff] ^
+		U4[j       & 0xff]
+		for j in i
+	)) for i in K[-2:0:-1])
+	iK.append(K[0])
+	
+	return tuple(iK)
 
 class AES(BlockCipher) :
-	__slots__ = ('K', 'iK', 'Nk', 'Nr') + BlockCipher.__slots__
+	__slots__ = ('K', '_iK', '_fK', '_fiK', 'Nk', 'Nr', 'encrypt_only') + BlockCipher.__slots__
 	
-	def __new__(cls, key: bytes, mode=BlockCipher.MODE_ECB, iv=bytes(16)) :
+	# encrypt_only: never build the decryption schedule, for CTR, CFB,
+	# 	OFB, GCM (decrypt too) or pure encryption it is not needed
+	def __new__(cls, key: bytes, mode=BlockCipher.MODE_ECB, iv=None, *, encrypt_only=False) :
 		self = super().__new__(cls, mode, iv)
 		
 		if len(key) not in (16, 24, 32) :
 			raise ValueError('AES key must be either 16, 24, or 32 bytes long, not {}.'
 					.format(len(key)))
 		
-		# for AES, Nb = 4
-		Nk = len(key) >> 2 # 4, 6, 8
-		self.Nr = Nk + 6 # Set as a attribute
+		self.K = self.schedule(key, expand_key)
+		self._fK = tuple(chain.from_iterable(self.K))
+		self.Nk, self.Nr = len(key) >> 2, len(self.K) - 1
+		self.encrypt_only = encrypt_only
+		
+		return self
 		
-		w = array('I', unpack('>'+'I'*Nk, key)+(0,)*4*self.Nr)
+	@property
+	def iK(self) :
+		# Built on the first use only
+		try :
+			return self._iK
+		except AttributeError :
+			pass
 		
-		for i in range(Nk, 4*self.Nr+4) :
-			temp = w[i-1]
-			if not (i % Nk) :
-				# RotWord -> i32 <<< 8
-				temp = (temp & 0xffffff)<<8 | temp>>24
-				
-				# SubWord -> SBOX: 32 bit -> 32 bit
-				temp = ((
-					SBox[temp >> 24       ] ^ rcon[i//Nk-1]) << 24 |
-					SBox[temp >> 16 & 0xff]                  << 16 |
-					SBox[temp >>  8 & 0xff]                  <<  8 |
-					SBox[temp       & 0xff]
-				)
-			elif Nk > 6 and i % Nk == 4 :
-				# SubWord -> SBOX: 32 bit -> 32 bit
-				temp = (
-					SBox[temp >> 24       ] << 24 |
-					SBox[temp >> 16 & 0xff] << 16 |
-					SBox[temp >>  8 & 0xff] <<  8 |
-					SBox[temp       & 0xff]
-				)
-			w[i] = w[i-Nk] ^ temp
-			
-		self.K = tuple(w[i:i+4] for i in range(0, 4*self.Nr+4, 4))
+		if self.encrypt_only :
+			raise TypeError('this AES object is encrypt-only, it can not decrypt blocks')
 		
-		# iK is different
-		self.iK = [self.K[-1]]
-		self.iK.extend(array('I', (
-			U1[j >> 24       ] ^
-			U2[j >> 16 & 0xff] ^
-			U3[j >>  8 & 0xff] ^
-			U4[j       & 0xff]
-			for j in i
-		)) for i in self.K[-2:0:-1])
-		self.iK.append(self.K[0])
+		# The first Nk words of the schedule are the key itself
+		key = pack('>'+'I'*self.Nk, *islice(chain.from_iterable(self.K), self.Nk))
+		self._iK = self.schedule(key, lambda key, K=self.K: inverse_key(K), '^-1')
+		return self._iK
 	
-		return self
+	def _flat_iK(self) :
+		# The decryption schedule as one tuple of words, for the kernels
+		try :
+			return self._fiK
+		except AttributeError :
+			self._fiK = tuple(chain.from_iterable(self.iK))
+			return self._fiK
 	
+	# One block goes through an unrolled kernel too, so do the
+	# 	block by block modes (CBC/CFB encryption, OFB), GCM and XTS tweaks
 	def encrypt_block(self, block) :
-		block = array('I', map(lambda i,j: i^j, unpack('>IIII', block), self.K[0]))
-		
-		for r in range(1, self.Nr) :
-			block[0], block[1], block[2], block[3] = (
-				TE1[block[i      ] >> 24       ] ^
-				TE2[block[i+1 & 3] >> 16 & 0xff] ^
-				TE3[block[i+2 & 3] >>  8 & 0xff] ^
-				TE4[block[i+3 & 3]       & 0xff] ^ k
-				for i,k in enumerate(self.K[r])
-			)
-		
-		return b''.join(bytes((
-			SBox[block[i      ] >> 24       ] ^ k >> 24,
-			SBox[block[i+1 & 3] >> 16 & 0xff] ^ k >> 16 & 0xff,
-			SBox[block[i+2 & 3] >>  8 & 0xff] ^ k >>  8 & 0xff,
-			SBox[block[i+3 & 3]       & 0xff] ^ k       & 0xff
-		)) for i,k in enumerate(self.K[self.Nr]))
+		return ENCRYPT_BLOCK[self.Nr](block, self._fK)
 		
 	def decrypt_block(self, block) :
-		block = array('I', map(lambda i,j: i^j, unpack('>IIII', block), self.iK[0]))
+		return DECRYPT_BLOCK[self.Nr](block, self._flat_iK())
 		
-		for r in range(1, self.Nr) :
-			block[0], block[1], block[2], block[3] = (
-				TD1[block[i      ] >> 24       ] ^
-				TD2[block[i+3 & 3] >> 16 & 0xff] ^
-				TD3[block[i+2 & 3] >>  8 & 0xff] ^
-				TD4[block[i+1 & 3]       & 0xff] ^ k
-				for i,k in enumerate(self.iK[r])
-			)
+	# Many blocks in one call, the result is one bytes
+	def encrypt_blocks(self, data) :
+		if np is not None and len(data) >= NUMPY_THRESHOLD :
+			return _numpy_blocks(data, self._fK)
+		return ENCRYPT_BLOCKS[self.Nr](data, self._fK)
 		
-		return b''.join(bytes((
-			InvSBox[block[i      ] >> 24       ] ^ k >> 24,
-			InvSBox[block[i+3 & 3] >> 16 & 0xff] ^ k >> 16 & 0xff,
-			InvSBox[block[i+2 & 3] >>  8 & 0xff] ^ k >>  8 & 0xff,
-			InvSBox[block[i+1 & 3]       & 0xff] ^ k       & 0xff
-		)) for i,k in enumerate(self.iK[self.Nr]))
+	def decrypt_blocks(self, data) :
+		if np is not None and len(data) >= NUMPY_THRESHOLD :
+			return _numpy_blocks(data, self._flat_iK(), True)
+		return DECRYPT_BLOCKS[self.Nr](data, self._flat_iK())
 		
 	block_size = 16
@@ -3,19 +3,205 @@
 # 	are used together.
 # Also some attributes.
 
+from array import array
+from collections import OrderedDict, namedtuple
+from itertools import islice, repeat
+from sys import byteorder
+from threading import Lock
+from . import _parallel
+
+# Optional: counter blocks are made by NumPy if it is there
+try :
+	import numpy as np
+except ImportError :
+	np = None
+
 __all__ = [
 	'Cipher',
 		'Asymmetric',
 		'Symmetric',
 			'BlockCipher',
+			'BlockCipherContext',
 			'StreamCipher',
 	'Hash',
 	'Random',
 		'PRNG',
+	'KeyScheduleCache',
+		'enable_schedule_cache',
+		'disable_schedule_cache',
+		'schedule_cache_info',
 ]
 
-_OFB, _CFB, _CBC, _CTR, _ECB = (
-	'OFB', 'CFB', 'CBC', 'CTR', 'ECB')
+_OFB, _CFB, _CBC, _CTR, _ECB, _GCM = (
+	'OFB', 'CFB', 'CBC', 'CTR', 'ECB', 'GCM')
+
+def _rebuild(cls, state) :
+	self = object.__new__(cls)
+	for k,v in state :
+		setattr(self, k, v)
+	return self
+
+# Bytes crypted per step (per worker) by crypt_into
+_WINDOW = 1 << 20
+
+def _crypt_into(crypt, src, dst, align=1) :
+	# src, dst: any buffer (bytes, bytearray, memoryview, mmap, array ...)
+	# dst may be src itself, for in place crypt.
+	# A window is crypted before it is written back, so the intermediate
+	# 	memory is bounded by the window size; windows are whole align units.
+	# crypt(i, window) -> the output to write at dst[i:]
+	src, dst = memoryview(src).cast('B'), memoryview(dst).cast('B')
+	dl = len(src)
+	if len(dst) < dl :
+		raise ValueError('dst is too small, {} bytes needed'.format(dl))
+	window = max(_WINDOW * _parallel.workers() // align, 1) * align
+	for i in range(0, dl, window) :
+		out = crypt(i, src[i:i+window])
+		dst[i:i+len(out)] = out
+	return dl
+
+def _xor(a, b) :
+	# a ^ b for two bytes-like of the same length
+	return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')
+		).to_bytes(len(a), 'big')
+
+def _blocks(data, bs) :
+	dl = len(data)
+	return map(data.__getitem__, map(slice, range(0, dl, bs), range(bs, dl+bs, bs)))
+
+def _counter_blocks(counter, n, bs, carry=True) :
+	# n big-endian counter blocks from counter on, made in bulk:
+	# 	the low 32-bit words come from one array, the high bytes stay the
+	# 	same over a run and are written by strided slices.
+	# carry: the whole block counts modulo 2^(8*bs) (CTR),
+	# 	else only the low 32 bits do and wrap alone (GCM inc32)
+	out, top = [], 1 << 8*bs
+	while n :
+		low = counter & 0xffffffff
+		m = min(n, (1 << 32) - low)
+		if np is not None :
+			words = np.arange(low, low + m, dtype='>u4').tobytes()
+		else :
+			words = array('I', range(low, low + m))
+			if byteorder == 'little' : words.byteswap()
+			words = words.tobytes()
+		
+		run = bytearray(bs * m)
+		for i, b in enumerate((counter >> 32).to_bytes(bs - 4, 'big')) :
+			if b :
+				run[i::bs] = bytes((b,)) * m
+		for i in range(4) :
+			run[bs-4+i::bs] = words[i::4]
+		out.append(run)
+		
+		n -= m
+		counter = counter + m & top-1 if carry else counter & ~0xffffffff
+	return b''.join(out)
+
+def _ctr_keystream(cipher, counter, nblocks) :
+	# E(counter), E(counter+1), ... in one bytes,
+	# 	the counter block wraps around modulo 2^(8*bs)
+	return cipher.encrypt_blocks(_counter_blocks(counter, nblocks, cipher.block_size))
+
+def _ctr_worker(cipher, counter, data) :
+	# Xor a whole shard with its keystream as two big integers
+	dl, bs = len(data), cipher.block_size
+	nblocks = -(-dl // bs)
+	ks = int.from_bytes(_ctr_keystream(cipher, counter, nblocks), 'big')
+	return (int.from_bytes(data, 'big') ^ ks >> (nblocks*bs - dl << 3)
+		).to_bytes(dl, 'big')
+
+def _ctr_crypt(cipher, counter, data) :
+	dl = len(data)
+	if not _parallel.enabled(dl) :
+		return _ctr_worker(cipher, counter, data)
+	
+	# Counter blocks are independent, every shard starts at
+	# 	its own counter and runs on its own core
+	bs, top = cipher.block_size, 1 << 8*cipher.block_size
+	bounds = _parallel.shards(dl, bs)
+	return b''.join(_parallel.pmap(_ctr_worker,
+		repeat(cipher),
+		(counter + i//bs & top-1 for i,_ in bounds),
+		(bytes(data[i:j]) for i,j in bounds)))
+
+def _cbc_decrypt_worker(cipher, last, data) :
+	# P[i] = D(C[i]) ^ C[i-1], all xors are done in one go
+	return _xor(cipher.decrypt_blocks(data), last + data[:-cipher.block_size])
+
+def _cbc_decrypt(cipher, last, data) :
+	dl, bs = len(data), cipher.block_size
+	if not _parallel.enabled(dl) :
+		return _cbc_decrypt_worker(cipher, last, data)
+	
+	# Unlike encryption, every plaintext block only needs C[i] and C[i-1],
+	# 	so shards overlap by one block: the last block of the previous one
+	bounds = _parallel.shards(dl, bs)
+	return b''.join(_parallel.pmap(_cbc_decrypt_worker,
+		repeat(cipher),
+		(bytes(data[i-bs:i]) if i else last for i,_ in bounds),
+		(bytes(data[i:j]) for i,j in bounds)))
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+class KeyScheduleCache(object) :
+	# A bounded LRU of expanded key schedules, keyed by (algorithm, key).
+	# Note: the cache holds the raw keys, only turn it on if that is fine
+	__slots__ = ('maxsize', 'hits', 'misses', '_data', '_lock')
+	
+	def __new__(cls, maxsize=4096) :
+		self = super().__new__(cls)
+		self.maxsize, self.hits, self.misses = maxsize, 0, 0
+		self._data, self._lock = OrderedDict(), Lock()
+		return self
+		
+	def get(self, name, key, expand) :
+		k = name, bytes(key)
+		with self._lock :
+			try :
+				schedule = self._data[k]
+			except KeyError :
+				self.misses += 1
+			else :
+				self.hits += 1
+				self._data.move_to_end(k)
+				return schedule
+		
+		# Expanding is done out of the lock, two threads might
+		# 	both expand the same new key, that is harmless
+		schedule = expand(key)
+		with self._lock :
+			self._data[k] = schedule
+			if len(self._data) > self.maxsize :
+				self._data.popitem(last=False)
+		return schedule
+		
+	def info(self) :
+		with self._lock :
+			return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+		
+	def clear(self) :
+		with self._lock :
+			self._data.clear()
+			self.hits = self.misses = 0
+
+
+# Off by default
+_schedule_cache = None
+
+def enable_schedule_cache(maxsize=4096) :
+	global _schedule_cache
+	_schedule_cache = KeyScheduleCache(maxsize)
+	return _schedule_cache
+
+def disable_schedule_cache() :
+	global _schedule_cache
+	_schedule_cache = None
+
+def schedule_cache_info() :
+	return None if _schedule_cache is None else _schedule_cache.info()
 
 
 class Cipher(object) :
@@ -35,7 +221,7 @@ class Symmetric(Cipher) :
 	
 
 class BlockCipher(Symmetric) :
-	__slots__ = ('mode', 'iv')
+	__slots__ = ('mode', 'iv', 'ghash', 'used_nonces')
 	
 	def __new__(cls, mode, iv=None) :
 		self = super().__new__(cls)
@@ -44,15 +230,37 @@ class BlockCipher(Symmetric) :
 		if mode == _ECB :
 			pass
 			
-		elif mode == _CBC :
+		elif mode in (_CBC, _CTR, _CFB, _OFB) :
+			# for CTR, iv is the initial counter block. It must be given:
+			# 	every encrypt starts from it, a default one would give
+			# 	every message (and every cipher) the same keystream
 			if iv is None :
+				if mode == _CTR :
+					raise ValueError('CTR mode needs an initial counter block (iv), a new one for every message')
 				iv = bytes(cls.block_size)
 				
-			elif len(iv) != 8 :
+			elif len(iv) != cls.block_size :
 				raise ValueError('for {} Algorithm, IV must be length {} bytes'
 					.format(cls.__name__, cls.block_size))
 					
 			self.iv = iv
+			
+		elif mode == _GCM :
+			# for GCM, iv is the nonce, 12 bytes is recommended.
+			# 	It must be given: a nonce used twice with one key
+			# 	gives away H and lets tags be forged
+			if cls.block_size != 16 :
+				raise ValueError('GCM mode needs a 128-bit block cipher, {} is not'
+					.format(cls.__name__))
+			
+			if iv is None :
+				raise ValueError('GCM mode needs a nonce (iv), a new one for every message')
+				
+			elif not iv :
+				raise ValueError('GCM nonce must not be empty')
+			
+			self.iv = iv
+			self.used_nonces = set()
 		
 		else :
 			raise NotImplementedError('Mode {} has not implemented'
@@ -60,79 +268,256 @@ class BlockCipher(Symmetric) :
 				
 		return self
 		
-	def itercrypt(self, data, block_generator) :
-		bs, dl = self.__class__.block_size, len(data)
-		if dl & bs-1 : # Little track
+	@classmethod
+	def schedule(cls, key, expand, kind='') :
+		# expand(key) -> key schedule, it goes through the cache if enabled.
+		# Schedules are shared between objects, never modify them
+		if _schedule_cache is None :
+			return expand(key)
+		return _schedule_cache.get(cls.__name__ + kind, key, expand)
+		
+	# Many blocks in one call, subclasses may have a batched kernel
+	def encrypt_blocks(self, data) :
+		return b''.join(map(self.encrypt_block, _blocks(data, self.block_size)))
+		
+	def decrypt_blocks(self, data) :
+		return b''.join(map(self.decrypt_block, _blocks(data, self.block_size)))
+		
+	def __reduce__(self) :
+		# Ship the expanded key schedule as it is,
+		# 	so a worker process never reruns the key expansion
+		return _rebuild, (self.__class__, tuple(
+			(k, getattr(self, k))
+			for k in {k for c in self.__class__.__mro__ for k in c.__dict__.get('__slots__', ())}
+			if hasattr(self, k)))
+		
+	# Like hashlib: ctx = cipher.encryptor(); ctx.update(...); ctx.finalize()
+	def encryptor(self) :
+		return BlockCipherContext(self, True)
+		
+	def decryptor(self) :
+		return BlockCipherContext(self, False)
+		
+	def itercrypt(self, chunks, encrypt=True) :
+		# Crypt an iterable of chunks (e.g. file reads) with constant memory.
+		# The old form itercrypt(data, self.encrypt_block) still works:
+		# 	a bytes-like is one chunk, and a block function gives the way
+		if callable(encrypt) :
+			encrypt = 'encrypt' in encrypt.__name__
+		if isinstance(chunks, (bytes, bytearray, memoryview)) :
+			chunks = (chunks,)
+		ctx = BlockCipherContext(self, encrypt)
+		for chunk in chunks :
+			yield ctx.update(chunk)
+		yield ctx.finalize()
+		
+	# Authenticated encryption, only for MODE_GCM
+	def encrypt_and_digest(self, data, aad=b'') :
+		from .gcm import encrypt_and_digest
+		if self.mode != _GCM :
+			raise ValueError('encrypt_and_digest needs MODE_GCM, not {}'.format(self.mode))
+		# Every encryption needs its own nonce, set self.iv to a new one
+		nonce = bytes(self.iv)
+		if nonce in self.used_nonces :
+			raise ValueError('GCM nonce {} has already been used to encrypt'.format(nonce.hex()))
+		self.used_nonces.add(nonce)
+		return encrypt_and_digest(self, data, aad)
+		
+	def decrypt_and_verify(self, data, tag, aad=b'') :
+		from .gcm import decrypt_and_verify
+		if self.mode != _GCM :
+			raise ValueError('decrypt_and_verify needs MODE_GCM, not {}'.format(self.mode))
+		return decrypt_and_verify(self, data, tag, aad)
+		
+	def crypt_into(self, src, dst, encrypt=True) :
+		# See _crypt_into, the block modes keep their state across windows
+		src, bs = memoryview(src).cast('B'), self.block_size
+		if len(src) % bs and self.mode in (_ECB, _CBC) :
 			raise ValueError('{} Algorithm data length must be multiples of {}'
 				.format(self.__class__.__name__, bs))
+		ctx = BlockCipherContext(self, encrypt)
+		dst = memoryview(dst).cast('B')
+		dl = _crypt_into(lambda i, window : ctx.update(window), src, dst, bs)
+		tail = ctx.finalize()
+		dst[dl-len(tail):dl] = tail
+		return dl
 		
-		blocks = map(
-			data.__getitem__,
-			map(
-				lambda i,s=slice,bs=bs: s(i, i + bs, None),
-				range(0, dl, bs)
-			)
-		)
+	def encrypt_into(self, src, dst) :
+		return self.crypt_into(src, dst, True)
 		
-		if self.mode == _ECB :
-			return map(block_generator, blocks)
-			
-		elif self.mode == _CBC :
-			def temp(
-				# note: it use function name to sign
-				sign='encrypt' in block_generator.__name__,
-				bxor=lambda a,b,bytes=bytes: bytes(i ^ j for i,j in zip(a, b)),
-				block_generator=block_generator,
-			) :
-				if sign :
-					_last_cipherblock = block_generator(bxor(next(blocks), self.iv))
-					yield _last_cipherblock
-					for block in blocks :
-						_last_cipherblock = block_generator(bxor(block, _last_cipherblock))
-						yield _last_cipherblock
-				else :
-					_last_cipherblock = next(blocks)
-					yield bxor(block_generator(_last_cipherblock), self.iv)
-					for block in blocks :
-						yield bxor(block_generator(block), _last_cipherblock)
-						_last_cipherblock = block
-				
-			return temp()
-			
-		elif self.mode == _CTR :
-			...
-			
-		elif self.mode == _CFB :
-			...
-			
-		elif self.mode == _OFB :
-			...
-
-		else :
-			raise ValueError('Unsupported mode: {}'.format(self.mode))
+	def decrypt_into(self, src, dst) :
+		return self.crypt_into(src, dst, False)
 		
 	def encrypt(self, data) :
-		return b''.join(self.itercrypt(data, self.encrypt_block))
+		ctx = BlockCipherContext(self, True)
+		return ctx.update(data) + ctx.finalize()
 	
 	def decrypt(self, data) :
-		return b''.join(self.itercrypt(data, self.decrypt_block))
+		ctx = BlockCipherContext(self, False)
+		return ctx.update(data) + ctx.finalize()
+		
+	MODE_OFB, MODE_CFB, MODE_CBC, MODE_CTR, MODE_ECB, MODE_GCM = (
+		_OFB, _CFB, _CBC, _CTR, _ECB, _GCM)
+
+
+class BlockCipherContext(object) :
+	# The chaining state of one message:
+	# 	CBC: last ciphertext block
+	# 	CFB, OFB: feedback register
+	# 	CTR: counter (int)
+	__slots__ = ('cipher', 'encrypting', 'state', 'buffer')
+	
+	def __new__(cls, cipher, encrypt=True) :
+		self = super().__new__(cls)
+		self.cipher, self.encrypting = cipher, encrypt
+		self.buffer = b''
+		
+		if cipher.mode == _GCM :
+			raise ValueError('GCM is one-shot, use encrypt_and_digest / decrypt_and_verify')
+		
+		if cipher.mode == _CTR :
+			self.state = int.from_bytes(cipher.iv, 'big')
+		elif cipher.mode != _ECB :
+			self.state = bytes(cipher.iv)
+		
+		return self
+		
+	def update(self, data) :
+		if self.buffer is None :
+			raise ValueError('Context has already been finalized')
+		
+		bs = self.cipher.block_size
+		if self.buffer :
+			data = self.buffer + data
+		
+		# Only whole blocks are crypted, the rest waits for more data
+		dl = len(data)
+		tail = dl % bs
+		self.buffer = bytes(data[dl-tail:])
+		if dl == tail :
+			return b''
+		return getattr(self, '_' + self.cipher.mode.lower())(
+			data[:dl-tail] if tail else data)
+		
+	def update_into(self, data, buf) :
+		# Returns how many bytes have been written into buf
+		out = self.update(data)
+		memoryview(buf).cast('B')[:len(out)] = out
+		return len(out)
+		
+	def finalize(self) :
+		data, cipher = self.buffer, self.cipher
+		if data is None :
+			raise ValueError('Context has already been finalized')
+		self.buffer = None
+		
+		if not data :
+			return b''
+		
+		if cipher.mode in (_ECB, _CBC) :
+			raise ValueError('{} Algorithm data length must be multiples of {}'
+				.format(cipher.__class__.__name__, cipher.block_size))
+		
+		# Stream modes: the last partial block uses a prefix of E(state)
+		if cipher.mode == _CTR :
+			state = self.state.to_bytes(cipher.block_size, 'big')
+		else :
+			state = self.state
+		return _xor(data, cipher.encrypt_block(state)[:len(data)])
 		
-	MODE_OFB, MODE_CFB, MODE_CBC, MODE_CTR, MODE_ECB = (
-		_OFB, _CFB, _CBC, _CTR, _ECB)
+	def _ecb(self, data) :
+		cipher = self.cipher
+		return (cipher.encrypt_blocks if self.encrypting else cipher.decrypt_blocks)(data)
+		
+	def _cbc(self, data) :
+		cipher, last = self.cipher, self.state
+		bs = cipher.block_size
+		if self.encrypting :
+			fn, out = cipher.encrypt_block, []
+			for block in _blocks(data, bs) :
+				last = fn(_xor(block, last))
+				out.append(last)
+			self.state = last
+			return b''.join(out)
+		
+		self.state = bytes(data[-bs:])
+		return _cbc_decrypt(cipher, last, data)
+		
+	def _cfb(self, data) :
+		cipher, last = self.cipher, self.state
+		bs, fn = cipher.block_size, cipher.encrypt_block
+		if self.encrypting :
+			out = []
+			for block in _blocks(data, bs) :
+				last = _xor(block, fn(last))
+				out.append(last)
+			self.state = last
+			return b''.join(out)
+		
+		# the feedback is the ciphertext we already have
+		self.state = bytes(data[-bs:])
+		return _xor(data, cipher.encrypt_blocks(last + data[:-bs]))
+		
+	def _ofb(self, data) :
+		cipher, last = self.cipher, self.state
+		fn, ks = cipher.encrypt_block, []
+		for _ in range(len(data) // cipher.block_size) :
+			last = fn(last)
+			ks.append(last)
+		self.state = last
+		return _xor(data, b''.join(ks))
+		
+	def _ctr(self, data) :
+		cipher, counter = self.cipher, self.state
+		self.state = counter + len(data)//cipher.block_size & (1 << 8*cipher.block_size) - 1
+		return _ctr_crypt(cipher, counter, data)
 
 
 class StreamCipher(Symmetric) :
-	__slots__ = ('keystream',)
+	__slots__ = ('keystream', '_stream')
 	
 	# Most common stream cipher use xor
 	# So the decrypt is total the same of encrypt
-	def itercrypt(self, data, _xor=lambda a,b: a^b) :
-		return map(_xor, self.keystream(), data)
+	#
+	# The keystream protocol: keystream_bytes(n) gives the next n bytes,
+	# 	keystream_into(buf) fills a buffer, both move the position on.
+	# 	By default they read self.keystream() byte by byte, a cipher
+	# 	overrides keystream_bytes to make whole chunks natively
+	def keystream_bytes(self, n) :
+		try :
+			stream = self._stream
+		except AttributeError :
+			stream = self._stream = iter(self.keystream())
+		return bytes(islice(stream, n))
+	
+	def keystream_into(self, buf) :
+		buf = memoryview(buf).cast('B')
+		buf[:] = self.keystream_bytes(len(buf))
+		return len(buf)
 	
 	def crypt(self, data) :
-		return bytes(self.itercrypt(data))
+		# Whole chunks are xored with their keystream as big integers,
+		# 	the position is kept, so a message can be crypted in pieces
+		# 	(and encrypt then decrypt on one object no longer round-trips:
+		# 	decrypt with a fresh cipher, or seek back where there is seek)
+		dl = len(data)
+		return b''.join(
+			_xor(data[i:i+_WINDOW], self.keystream_bytes(min(_WINDOW, dl-i)))
+			for i in range(0, dl, _WINDOW))
+	
+	def itercrypt(self, data) :
+		return iter(self.crypt(data))
 	
 	encrypt = decrypt = crypt
+	
+	# Checkpoints: getstate() -> bytes, setstate(bytes) of a cipher
+	# 	that has one, the keystream goes on from the same byte.
+	# Note: the state is as secret as the key
+	@classmethod
+	def from_state(cls, state) :
+		self = object.__new__(cls)
+		self.setstate(state)
+		return self
 
 
 class Hash(object) :
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Throughput and latency benchmarks of every cipher, hash and PRNG.
+#
+# Usage:
+# 	python -m MyCrypto.bench [-o now.json] [--sizes 64,1024,16384] [--only AES,SM4]
+# 	python -m MyCrypto.bench --compare base.json [-i now.json] [--tolerance 0.1]
+#
+# For each case it reports:
+# 	throughput  MB/s for every message size
+# 	setup       key setup time (median, µs)
+# 	latency     per call time on a small message (p50 / p90 / p99, µs)
+#
+# PRNGs: every generator of _prng.py but mt19937, which is a seed -> one
+# 	number function that rebuilds its 624-word table on every call (about
+# 	2.5 ms per 4 bytes, so ~10 s per 16 KiB message). prng.py is not timed
+# 	on its own, its Xorshift32, Xorshift64s and isaac are _prng.py's code.
+
+from collections import namedtuple
+from itertools import islice
+from json import dump, load
+from os import urandom
+from platform import platform, python_version
+from time import perf_counter, strftime
+from warnings import catch_warnings, simplefilter
+import argparse
+import sys
+
+from .aes import AES
+from .sm4 import SM4
+from .des import DES, TripleDES
+from .chacha20 import ChaCha20
+from .rc4 import RC4, RC4P
+from .zuc import ZUC
+from .rsa import RSA, RSA_BLOCK
+from ._crc import CRC16, CRC32, CRC64
+from ._prng import (Xorshift32, Xorshift64, Xorshift64h, Xorshift64s,
+	Xorshift128, Xorshift128p, Xorshift1024s, isaac)
+
+SIZES = (64, 1024, 16384)
+LATENCY_SIZE = 64
+
+# setup() -> state, key setup is what setup() costs
+# run(state, data) -> anything, one call on a message
+Case = namedtuple('Case', ('name', 'setup', 'run'))
+
+def _block(cls, *keys, mode='ECB', **kwds) :
+	return lambda : cls(*map(urandom, keys), mode, **kwds)
+
+def _aead(state, data) :
+	return state.encrypt_and_digest(data)
+
+def _gcm(state, data) :
+	# GCM refuses a nonce twice, every message gets a new one
+	state.iv = urandom(12)
+	return state.encrypt_and_digest(data)
+
+def _prng(cls) :
+	def run(state, data) :
+		# 8 bytes per output
+		return list(islice(iter(state), len(data) >> 3))
+	return Case(cls.__name__, cls, run)
+
+def _step(func, bits) :
+	# Generators of one function, state -> next state: the state is kept
+	# 	to its word size, every step makes bits/8 bytes
+	mask, size = (1 << bits) - 1, bits >> 3
+	def run(state, data) :
+		n = state
+		for _ in range(len(data) // size) :
+			n = func(n) & mask
+		return n
+	return run
+
+def _isaac(state, data) :
+	# One call makes 256 words (1 KiB). The words are not reduced, so
+	# 	every call starts from a copy of the seed instead of the last state
+	return [isaac(0, 0, 0, state[:]) for _ in range(-(-len(data) >> 10))]
+
+_rsa = None
+def _rsa_setup(bit_size=256) :
+	global _rsa
+	_rsa = RSA(bit_size=bit_size)
+	return _rsa
+
+def _rsa_run(state, data) :
+	# Plain RSA only crypts one number below N, so one call per piece
+	n = state.N.bit_length() - 1 >> 3
+	return [state.encrypt(data[i:i+n]) for i in range(0, len(data), n)]
+
+CASES = (
+	Case('AES-128', _block(AES, 16), lambda s,d: s.encrypt(d)),
+	Case('AES-192', _block(AES, 24), lambda s,d: s.encrypt(d)),
+	Case('AES-256', _block(AES, 32), lambda s,d: s.encrypt(d)),
+	Case('AES-128-CTR', _block(AES, 16, mode='CTR', iv=bytes(16), encrypt_only=True), lambda s,d: s.encrypt(d)),
+	Case('AES-128-GCM', _block(AES, 16, mode='GCM', iv=bytes(12), encrypt_only=True), _gcm),
+	Case('SM4', _block(SM4, 16), lambda s,d: s.encrypt(d)),
+	Case('DES', _block(DES, 8), lambda s,d: s.encrypt(d)),
+	Case('3DES', lambda : TripleDES(urandom(8), urandom(8), urandom(8)), lambda s,d: s.encrypt(d)),
+	Case('ChaCha20', lambda : ChaCha20(urandom(32), urandom(12)), lambda s,d: s.crypt(d)),
+	Case('ChaCha20-Poly1305', lambda : ChaCha20(urandom(32), urandom(12)), _aead),
+	Case('RC4', lambda : RC4(urandom(16)), lambda s,d: s.crypt(d)),
+	Case('RC4P', lambda : RC4P(urandom(16)), lambda s,d: s.crypt(d)),
+	Case('ZUC', lambda : ZUC(urandom(16), urandom(16)), lambda s,d: s.crypt(d)),
+	Case('RSA', _rsa_setup, _rsa_run),
+	Case('RSA_BLOCK', lambda : RSA_BLOCK.from_rsa(_rsa or _rsa_setup()), lambda s,d: s.encrypt(d)),
+	Case('CRC16', lambda : None, lambda s,d: CRC16(d)),
+	Case('CRC32', lambda : None, lambda s,d: CRC32(d)),
+	Case('CRC64', lambda : None, lambda s,d: CRC64(d)),
+	Case('Xorshift32', lambda : 2463534242, _step(Xorshift32, 32)),
+	Case('Xorshift64', lambda : 88172645463325292, _step(Xorshift64, 64)),
+	Case('Xorshift64h', lambda : 88172645463325292, _step(Xorshift64h, 64)),
+	Case('Xorshift64s', lambda : 0x2545f4914f6cdd1d, _step(Xorshift64s, 64)),
+	Case('Xorshift128', lambda : 0x075bcd15159a55e51f123bb505491333, _step(Xorshift128, 128)),
+	_prng(Xorshift128p),
+	_prng(Xorshift1024s),
+	Case('isaac', lambda : list(urandom(256)), _isaac),
+)
+
+def _percentile(sorted_times, p) :
+	return sorted_times[min(len(sorted_times) - 1, int(p * len(sorted_times)))]
+
+def measure(case, sizes=SIZES, min_time=0.2, setup_rounds=5, latency_calls=50) :
+	result = {}
+
+	times = []
+	for _ in range(setup_rounds) :
+		t = perf_counter()
+		state = case.setup()
+		times.append(perf_counter() - t)
+	times.sort()
+	result['setup_us'] = _percentile(times, 0.5) * 1e6
+
+	result['throughput_MBps'] = throughput = {}
+	for size in sizes :
+		data, calls, t = urandom(size), 0, perf_counter()
+		while True :
+			case.run(state, data)
+			calls += 1
+			elapsed = perf_counter() - t
+			if elapsed >= min_time :
+				break
+		throughput[str(size)] = size * calls / elapsed / 1e6
+
+	data, times = urandom(LATENCY_SIZE), []
+	for _ in range(latency_calls) :
+		t = perf_counter()
+		case.run(state, data)
+		times.append(perf_counter() - t)
+	times.sort()
+	result['latency_us'] = {
+		'p%d' % (p*100): _percentile(times, p) * 1e6 for p in (0.5, 0.9, 0.99)}
+
+	return result
+
+def run(cases=CASES, only=None, **kwds) :
+	results = {}
+	with catch_warnings() :
+		simplefilter('ignore')
+		for case in cases :
+			if only and case.name not in only :
+				continue
+			results[case.name] = measure(case, **kwds)
+	return {
+		'meta': {
+			'python': python_version(),
+			'platform': platform(),
+			'time': strftime('%Y-%m-%dT%H:%M:%S'),
+		},
+		'results': results,
+	}
+
+def compare(base, now, tolerance=0.1) :
+	# -> [(case, metric, base value, new value)] of every regression:
+	# 	throughput lower or times higher than the tolerance allows
+	regressions = []
+	for name, old in base['results'].items() :
+		new = now['results'].get(name)
+		if new is None :
+			continue
+		for size, v in old['throughput_MBps'].items() :
+			w = new['throughput_MBps'].get(size)
+			if w is not None and w < v * (1 - tolerance) :
+				regressions.append((name, 'throughput_MBps[%s]' % size, v, w))
+		if new['setup_us'] > old['setup_us'] * (1 + tolerance) :
+			regressions.append((name, 'setup_us', old['setup_us'], new['setup_us']))
+		for p, v in old['latency_us'].items() :
+			w = new['latency_us'].get(p)
+			if w is not None and w > v * (1 + tolerance) :
+				regressions.append((name, 'latency_us[%s]' % p, v, w))
+	return regressions
+
+def report(results, file=sys.stdout) :
+	sizes = sorted({int(s) for r in results['results'].values() for s in r['throughput_MBps']})
+	print('{:<18}{:>11}'.format('case', 'setup µs')
+		+ ''.join('{:>11}'.format('%dB MB/s' % s) for s in sizes)
+		+ '{:>9}{:>9}{:>9}'.format('p50 µs', 'p90 µs', 'p99 µs'), file=file)
+	for name, r in results['results'].items() :
+		print('{:<18}{:>11.1f}'.format(name, r['setup_us'])
+			+ ''.join('{:>11.3f}'.format(r['throughput_MBps'].get(str(s), 0)) for s in sizes)
+			+ ''.join('{:>9.1f}'.format(v) for v in r['latency_us'].values()), file=file)
+
+def main(argv=None) :
+	parser = argparse.ArgumentParser(prog='python -m MyCrypto.bench', description=
+		'Benchmark the throughput, key setup and latency of every primitive.')
+	parser.add_argument('-o', '--output', help='write the results as JSON here')
+	parser.add_argument('-i', '--input', help='read the results from here instead of running')
+	parser.add_argument('--compare', metavar='BASELINE', help='flag regressions against this JSON')
+	parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown (default 0.1)')
+	parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='message sizes in bytes')
+	parser.add_argument('--only', help='comma separated case names')
+	parser.add_argument('--min-time', type=float, default=0.2, help='seconds per size (default 0.2)')
+	args = parser.parse_args(argv)
+
+	if args.input :
+		with open(args.input) as f :
+			results = load(f)
+	else :
+		results = run(
+			only=args.only and set(args.only.split(',')),
+			sizes=tuple(map(int, args.sizes.split(','))),
+			min_time=args.min_time)
+	report(results)
+
+	if args.output :
+		with open(args.output, 'w') as f :
+			dump(results, f, indent='\t')
+
+	if args.compare :
+		with open(args.compare) as f :
+			regressions = compare(load(f), results, args.tolerance)
+		print()
+		for name, metric, old, new in regressions :
+			print('REGRESSION {:<18}{:<24}{:>12.3f} -> {:.3f}'.format(name, metric, old, new))
+		if regressions :
+			return 1
+		print('No regression (tolerance {:.0%})'.format(args.tolerance))
+	return 0
+
+if __name__ == '__main__' :
+	sys.exit(main())
@@ -3,12 +3,23 @@
 # Also https://datatracker.ietf.org/doc/html/rfc7539
 # See  https://tools.ietf.org/html/draft-arciszewski-xchacha-03 (XChaCha20)
 # Also https://cr.yp.to/chacha/chacha-20080120.pdf
+# AEAD (ChaCha20-Poly1305): see poly1305.py
 # Note: the implementation does not support 16-byte key
 
 from os import urandom
 from array import array
+from itertools import chain, islice, repeat
 from struct import unpack, pack
-from .base import StreamCipher
+from sys import byteorder
+from .base import StreamCipher, _rebuild, _xor
+from . import _parallel
+
+# Optional: NumPy runs the double rounds over many counters at once,
+# 	one uint32 lane per keystream block (see _numpy_rounds)
+try :
+	import numpy as np
+except ImportError :
+	np = None
 
 def ROT32L(i32, n) :
 	return i32 << n & 0xffffffff | i32 >> 32-n
@@ -33,9 +44,111 @@ def XROUND2(x, QUARTERROUND=QUARTERROUND) :
 	x[2], x[7], x[ 8], x[13] = QUARTERROUND(x[2], x[7], x[ 8], x[13]); # diagonal 3
 	x[3], x[4], x[ 9], x[14] = QUARTERROUND(x[3], x[4], x[ 9], x[14]); # diagonal 4
 
+SIGMA = (0x61707865, 0x3320646e, 0x79622d32, 0x6b206574) # "expand 32-byte k"
+
+def HChaCha20(template, b16) :
+	# template: SIGMA and the 8 key words, b16: the first 16 bytes of an XChaCha20 nonce
+	x = array('I', template + unpack('<IIII', b16))
+	for _ in range(10) : XROUND2(x)
+	# take the only first 128 bits & last 128 bits, no feed forward
+	return tuple(x[:4]) + tuple(x[12:])
+
+
+def _kernel() :
+	# blocks(s, counter, n, wide) -> n keystream blocks for the state s,
+	# 	the counter is word 12 (or words 12, 13 when wide, 64-bit)
+	# The 20 rounds run on local integers, the quarter rounds unrolled
+	rounds = (
+		(0, 4,  8, 12), (1, 5,  9, 13), (2, 6, 10, 14), (3, 7, 11, 15), # columns
+		(0, 5, 10, 15), (1, 6, 11, 12), (2, 7,  8, 13), (3, 4,  9, 14), # diagonals
+	)
+	x = ', '.join('x%d' % i for i in range(16))
+	s = ', '.join('s%d' % i for i in range(16))
+	src = [
+		'def blocks(s, counter, n, wide, M=0xffffffff) :',
+		'	{} = s'.format(s),
+		'	out = []',
+		'	for c in range(counter, counter + n) :',
+		'		s12 = c & M',
+		'		if wide : s13 = c >> 32 & M',
+		'		{} = {}'.format(x, s),
+		'		for _ in range(10) :',
+	]
+	for a, b, c, d in rounds :
+		for (i, j, k), n in zip(((a, b, d), (c, d, b), (a, b, d), (c, d, b)), (16, 12, 8, 7)) :
+			src.append('			x{i} = x{i} + x{j} & M; x{k} ^= x{i}; x{k} = x{k} << {n} & M | x{k} >> {m}'
+				.format(i=i, j=j, k=k, n=n, m=32-n))
+	src.extend((
+		'		out += ({},)'.format(', '.join('x{0} + s{0} & M'.format(i) for i in range(16))),
+		'	w = array("I", out)',
+		'	if byteorder == "big" : w.byteswap()',
+		'	return w.tobytes()',
+	))
+	
+	namespace = dict(globals())
+	exec('\n'.join(src), namespace)
+	return namespace['blocks']
+
+blocks = _kernel()
+
+# Shorter keystreams go through the unrolled blocks() kernel,
+# 	setting up the 16 word vectors costs more than it saves there
+NUMPY_THRESHOLD = 1 << 12
+
+def _numpy_rounds(x) :
+	# x: the 16 state words, each a uint32 vector with one lane per block,
+	# 	one run of the 20 rounds makes all the blocks
+	init = [i.copy() for i in x]
+	
+	for _ in range(10) :
+		for a, b, c, d in (
+			(0, 4,  8, 12), (1, 5,  9, 13), (2, 6, 10, 14), (3, 7, 11, 15),
+			(0, 5, 10, 15), (1, 6, 11, 12), (2, 7,  8, 13), (3, 4,  9, 14),
+		) :
+			xa, xb, xc, xd = x[a], x[b], x[c], x[d]
+			xa += xb; xd ^= xa; xd = xd << 16 | xd >> 16
+			xc += xd; xb ^= xc; xb = xb << 12 | xb >> 20
+			xa += xb; xd ^= xa; xd = xd <<  8 | xd >> 24
+			xc += xd; xb ^= xc; xb = xb <<  7 | xb >> 25
+			x[a], x[b], x[c], x[d] = xa, xb, xc, xd
+	
+	out = np.empty((len(x[0]), 16), dtype='<u4')
+	for i in range(16) :
+		out[:, i] = x[i] + init[i]
+	return out.tobytes()
+
+def _numpy_blocks(s, counter, n, wide) :
+	# n blocks of one state, a lane per counter
+	ctr = np.arange(counter, counter + n, dtype=np.uint64)
+	x = [np.full(n, w, dtype=np.uint32) for w in s]
+	x[12] = (ctr & 0xffffffff).astype(np.uint32)
+	if wide :
+		x[13] = (ctr >> 32).astype(np.uint32)
+	return _numpy_rounds(x)
+
+def _numpy_many(states, counts) :
+	# counts[i] blocks of states[i] (counters from 0), all in one run:
+	# 	the lanes of a packet share its state, only word 12 counts
+	counts = np.array(counts, dtype=np.intp)
+	total = int(counts.sum())
+	s = np.repeat(np.array(states, dtype=np.uint32), counts, axis=0)
+	s[:, 12] = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+	return _numpy_rounds([s[:, i].copy() for i in range(16)])
+
+def _blocks(s, counter, n, wide) :
+	if np is not None and n << 6 >= NUMPY_THRESHOLD :
+		return _numpy_blocks(s, counter, n, wide)
+	return blocks(s, counter, n, wide)
+
+# Bytes crypted per step by crypt, bounds the keystream held in memory
+CHUNK = 1 << 16
+
+def _crypt_at(cipher, offset, data) :
+	return cipher._crypt(offset, data)
+
 
 class ChaCha20(StreamCipher) :
-	__slots__ = ('keystream', '_nonce', '__key', '__basemat')
+	__slots__ = ('_nonce', '_offset', '__template', '__basemat')
 	
 	def __new__(cls, key, nonce=None) :
 		#   key: 32 byte (256 bit)
@@ -47,71 +160,160 @@ class ChaCha20(StreamCipher) :
 		self = super().__new__(cls)
 		if nonce is None : nonce = urandom(12)
 		
-		self.__key = unpack('<IIIIIIII', key)
+		# The constants and the key words, every state starts from them
+		self.__template = SIGMA + unpack('<IIIIIIII', key)
 		self.nonce = nonce # unpack('<III', nonce)
 		
 		return self
 	
+	def _state(self, nonce) :
+		# -> the initial state for a nonce, its counter words are set per block
+		# the little nonce design makes a difficult
+		template = self.__template
+		if len(nonce) == 8 :
+			return template + (0, 0) + unpack('<II', nonce)
+		if len(nonce) == 12 :
+			return template + (0,) + unpack('<III', nonce)
+		if len(nonce) == 24 :
+			# XChaCha20: a subkey per nonce, the template keeps the key
+			return (SIGMA + HChaCha20(template, nonce[:16])
+				+ (0, 0) + unpack('<II', nonce[16:]))
+		raise ValueError('Chacha20 nonce must be either 8, 12, or 24 bytes long, not {}.'
+				.format(len(nonce)))
+	
 	@property
 	def nonce(self) :
 		return self._nonce
 		
 	@nonce.setter
 	def nonce(self, b8_12_24: bytes) :
-		# the little nonce design makes a difficult
-		if len(b8_12_24) == 8 :
-			n8_12_24 = unpack('<II', b8_12_24)
-			def stream(keys=self.__key, nonces=n8_12_24) :
-				mat = array('I', (
-					0x61707865, 0x3320646e, 0x79622d32, 0x6b206574,
-					*keys, # own 8 index
-					0, 0, *nonces))
-				counter = 0
-				while True :
-					x = mat[:]
-					for _ in range(10) : XROUND2(x)
-					for i,j in enumerate(mat) :
-						x[i] = x[i] + j & 0xffffffff
-					for i in x.tobytes() :
-						yield i
-					counter += 1
-					if counter & ~0xffffffff : # as > ..32bit
-						mat[12], mat[13] = counter&0xffffffff, counter>>32
-					else :
-						mat[13] = counter
-					
-		elif len(b8_12_24) == 12 :
-			n8_12_24 = unpack('<III', b8_12_24)
-			def stream(keys=self.__key, nonces=n8_12_24) :
-				mat = array('I', (
-					0x61707865, 0x3320646e, 0x79622d32, 0x6b206574,
-					*keys,
-					0, *nonces))
-				while True :
-					x = mat[:]
-					for _ in range(10) : XROUND2(x)
-					for i,j in enumerate(mat) :
-						x[i] = x[i] + j & 0xffffffff
-					for i in x.tobytes() :
-						yield i
-					mat[8] += 1 # ++counter
-					
-		elif len(b8_12_24) == 24 :
-			def HChaCha20(b16_m4) :
-				mat = array('I', (
-					0x61707865, 0x3320646e, 0x79622d32, 0x6b206574,
-					*self.__key,
-					*b16_m4))
-				x = mat[:]
-				for _ in range(10) : XROUND2(x)
-				# take the only first 128 bits & last 128 bits
-				return x[:4] + x[12:]
-			
-			self.__key = HChaCha20(unpack('<IIII', b8_12_24[:16]))
-			self.nonce = b'\0\0\0\0' + b8_12_24[16:] # note: recursive
-			return
-			
-		else :
-			raise ValueError('Chacha20 nonce must be either 16, 24, or 32 bytes long, not {}.'
-					.format(len(b8_12_24)))
-		self.keystream = stream
+		self.__basemat = self._state(b8_12_24)
+		self._nonce = b8_12_24
+		self._offset = 0 # a new nonce is a new keystream
+		
+	def __reduce__(self) :
+		# for the process pool, the state goes as it is
+		return _rebuild, (self.__class__, tuple(
+			(k, getattr(self, k)) for k in
+			('_nonce', '_offset', '_ChaCha20__template', '_ChaCha20__basemat')))
+		
+	def getstate(self) :
+		# position (8 bytes) || key (32 bytes) || nonce (8, 12 or 24 bytes)
+		return pack('<Q8I', self._offset, *self.__template[4:]) + bytes(self._nonce)
+		
+	def setstate(self, state) :
+		if len(state) not in (48, 52, 64) :
+			raise ValueError('not a state of {}'.format(self.__class__.__name__))
+		offset, *key = unpack('<Q8I', state[:40])
+		self.__template = SIGMA + tuple(key)
+		self.nonce = bytes(state[40:])
+		self.seek(offset)
+		
+	def _end(self, end=0) :
+		# -> the end of the keystream in bytes: the block counter has 32 bits
+		# 	with a 12 or 24-byte nonce, 64 with an 8-byte one. Past it the
+		# 	counter would wrap and the keystream be reused, so it is an error
+		# 	to need keystream up to end beyond it.
+		limit = 64 << (64 if len(self._nonce) == 8 else 32)
+		if end > limit :
+			raise ValueError('the keystream of a {}-byte nonce ends at byte {}, {} needed'
+				.format(len(self._nonce), limit, end))
+		return limit
+		
+	# The position (in bytes) crypt and keystream start from
+	def seek(self, offset) :
+		if offset < 0 :
+			raise ValueError('offset must not be negative')
+		self._end(offset)
+		self._offset = offset
+		
+	def tell(self) :
+		return self._offset
+		
+	def keyblocks(self, nblocks=1) :
+		# The keystream from the block of the position on, nblocks*64 bytes
+		# 	at a time (less for the last ones, up to the end of the counter)
+		end = self._end(self._offset + 1) >> 6
+		base, wide = self.__basemat, len(self._nonce) == 8
+		return (_blocks(base, counter, min(nblocks, end - counter), wide)
+			for counter in range(self._offset >> 6, end, nblocks))
+		
+	def keystream(self) :
+		# byte by byte, as other stream ciphers, the position is not moved
+		return islice(chain.from_iterable(self.keyblocks(16)), self._offset & 63, None)
+		
+	def _crypt(self, offset, data) :
+		# Xor whole chunks with their keystream as big integers,
+		# 	the first block needed is offset//64, no keystream before it is made
+		base, wide = self.__basemat, len(self._nonce) == 8
+		out, dl = [], len(data)
+		for i in range(0, dl, CHUNK) :
+			chunk = data[i:i+CHUNK]
+			cl = len(chunk)
+			counter, skip = divmod(offset + i, 64)
+			out.append(_xor(chunk, _blocks(base, counter, skip + cl + 63 >> 6, wide)[skip:skip+cl]))
+		return b''.join(out)
+		
+	def crypt_at(self, offset, data) :
+		# Random access: crypt data as if it was at byte offset of the message
+		if offset < 0 :
+			raise ValueError('offset must not be negative')
+		dl = len(data)
+		self._end(offset + dl)
+		if not _parallel.enabled(dl) :
+			return self._crypt(offset, data)
+		
+		# Blocks are independent, every shard starts at its own block
+		bounds = _parallel.shards(dl, 64)
+		return b''.join(_parallel.pmap(_crypt_at,
+			repeat(self),
+			(offset + i for i,_ in bounds),
+			(bytes(data[i:j]) for i,j in bounds)))
+		
+	def keystream_bytes(self, n) :
+		# the next n bytes, made as whole blocks
+		offset, wide = self._offset, len(self._nonce) == 8
+		self._end(offset + n)
+		counter, skip = divmod(offset, 64)
+		self._offset = offset + n
+		return _blocks(self.__basemat, counter, skip + n + 63 >> 6, wide)[skip:skip+n]
+		
+	def crypt(self, data) :
+		# from the position on, which moves past data
+		out = self.crypt_at(self._offset, data)
+		self._offset += len(data)
+		return out
+	
+	encrypt = decrypt = crypt
+	
+	def crypt_many(self, packets) :
+		# packets: [(nonce, data), ...] -> [crypttext, ...]
+		# 	every packet is crypted from the start of its own nonce's keystream,
+		# 	the states come from the key template, self is left as it is
+		states, wides, datas = [], [], []
+		for nonce, data in packets :
+			states.append(self._state(nonce))
+			wides.append(len(nonce) == 8)
+			datas.append(data)
+		counts = [len(d) + 63 >> 6 for d in datas]
+	
+		if np is not None and sum(counts) << 6 >= NUMPY_THRESHOLD :
+			# All the blocks of all the packets in one vectorized run
+			ks, out, i = _numpy_many(states, counts), [], 0
+			for d, n in zip(datas, counts) :
+				out.append(_xor(d, ks[i:i+len(d)]))
+				i += n << 6
+			return out
+		return [_xor(d, blocks(s, 0, n, w)[:len(d)])
+			for s, w, d, n in zip(states, wides, datas, counts)]
+	
+	encrypt_many = decrypt_many = crypt_many
+
+	# ChaCha20-Poly1305 (RFC 8439), XChaCha20-Poly1305 with a 24-byte nonce
+	def encrypt_and_digest(self, data, aad=b'') :
+		from .poly1305 import encrypt_and_digest
+		return encrypt_and_digest(self, data, aad)
+		
+	def decrypt_and_verify(self, data, tag, aad=b'') :
+		from .poly1305 import decrypt_and_verify
+		return decrypt_and_verify(self, data, tag, aad)
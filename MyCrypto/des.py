@@ -4,7 +4,7 @@
 
 from .base import BlockCipher
 from array import array
-from struct import unpack, pack
+from struct import iter_unpack, unpack, pack
 
 INITIAL_PERMUTATION = bytes((
 	57, 49, 41, 33, 25, 17,  9, 1,
@@ -118,117 +118,355 @@ SUBSTITUTION_BOX8 = bytes((
 	 2,  1, 14,  7,  4, 10,  8, 13, 15, 12,  9,  0,  3,  5,  6, 11,
 ))
 
+SUBSTITUTION_BOXs = (
+	SUBSTITUTION_BOX1, SUBSTITUTION_BOX2, SUBSTITUTION_BOX3, SUBSTITUTION_BOX4,
+	SUBSTITUTION_BOX5, SUBSTITUTION_BOX6, SUBSTITUTION_BOX7, SUBSTITUTION_BOX8,
+)
+
+# The bit by bit permutations, only used to build the tables below
+def _ip(b64, table=INITIAL_PERMUTATION) :
+	return sum((b64 >> j & 1) << i for i,j in enumerate(table))
+
+def _fp(b64) :
+	return _ip(b64, INVERSE_PERMUTATION)
+
+def _pc1(k64) :
+	return sum((k64 >> 63-j & 1) << 55-i for i,j in enumerate(PERMUTED_CHOICE1))
+
+def _pc2(k56) :
+	return sum((k56 >> 55-j & 1) << 47-i for i,j in enumerate(PERMUTED_CHOICE2))
+
+def _p(i32) :
+	return sum((i32 >> 31-j & 1) << 31-i for i,j in enumerate(PERMUTATION))
+
+def _split(k48) :
+	# The 6-bit pieces of a round key, piece n is for S-box 8-n.
+	# Even pieces go into the bytes of the low word, odd ones into
+	# 	the bytes of the high word, the same layout f() cuts E(R) into
+	lo = hi = 0
+	for n in range(0, 8, 2) :
+		lo |= (k48 >> 6*n & 63) << 4*n
+		hi |= (k48 >> 6*n+6 & 63) << 4*n
+	return hi << 32 | lo
+
+def _byte_tables(permute, n, typecode='Q') :
+	# All permutations are linear, so permute(x) is the OR of
+	# 	permute(byte i of x) over all bytes, and each byte table
+	# 	is built from the images of its 8 bits
+	tables = []
+	for i in range(n) :
+		t = [0]*256
+		for j in range(8) :
+			bit, image = 1 << j, permute(1 << 8*i+j)
+			for b in range(bit) :
+				t[b | bit] = t[b] | image
+		tables.append(array(typecode, t))
+	return tuple(tables)
+
+# IP and FP: 8 lookups instead of 64 bit moves
+IP = _byte_tables(_ip, 8)
+FP = _byte_tables(_fp, 8)
+# PC1 takes the 64-bit key, PC2 takes C << 28 | D
+# 	and gives the round key already split for f()
+PC1 = _byte_tables(_pc1, 8)
+PC2 = _byte_tables(lambda k56: _split(_pc2(k56)), 7)
+
+# SP-boxes: S-box n and then P, SP[n][6-bit piece] for S-box 8-n
+SP = tuple(
+	array('I', (
+		_p(box[c >> 1 & 15 | c << 4 & 16 | c & 32] << 4*n) for c in range(64)))
+	for n, box in enumerate(reversed(SUBSTITUTION_BOXs)))
+
 ROTATES = bytes((1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1,))
 
 
-class DES(BlockCipher) :
-	__slots__ = ('K', 'iK') + BlockCipher.__slots__
+def expand_key(key) :
+	# K = lo1, hi1, lo2, hi2 ... two words per round, see _split
+	K = array('I')
 	
-	def __new__(cls, key, mode=BlockCipher.MODE_ECB, iv=bytes(8)) :
-		self = super().__new__(cls, mode, iv)
-		if len(key) != 8 :
-			raise ValueError('key must be a length 8 bytes.')
+	k64 = unpack('>Q', key)[0]
+	P0, P1, P2, P3, P4, P5, P6, P7 = PC1
+	k56 = (
+		P0[k64       & 255] | P1[k64 >>  8 & 255] |
+		P2[k64 >> 16 & 255] | P3[k64 >> 24 & 255] |
+		P4[k64 >> 32 & 255] | P5[k64 >> 40 & 255] |
+		P6[k64 >> 48 & 255] | P7[k64 >> 56      ]
+	)
+	
+	# get C0, D0
+	C, D = k56 >> 28, k56 & 0xfffffff
+	
+	P0, P1, P2, P3, P4, P5, P6 = PC2
+	for i in ROTATES :
+		# (C, D) <<<= i
+		C = C << i & 0xfffffff | C >> 28-i
+		D = D << i & 0xfffffff | D >> 28-i
 		
-		# Initialize the K s
-		self.K = array('Q')
+		k56 = C << 28 | D
+		k = (
+			P0[k56       & 255] | P1[k56 >>  8 & 255] |
+			P2[k56 >> 16 & 255] | P3[k56 >> 24 & 255] |
+			P4[k56 >> 32 & 255] | P5[k56 >> 40 & 255] |
+			P6[k56 >> 48      ]
+		)
+		K.append(k & 0xffffffff)
+		K.append(k >> 32)
+	
+	# the decryption schedule is the rounds in reverse, word pairs kept
+	iK = array('I')
+	for i in range(30, -2, -2) :
+		iK.extend(K[i:i+2])
+	return K, iK
+
+def crypt_blocks(data, *schedules) :
+	# DES on every 8-byte block of data, once for each key schedule.
+	# Between two DES the FP and the next IP cancel out, all that is
+	# 	left is the swap of the halves, so 3DES is one IP, 48 rounds
+	# 	and one FP
+	I0, I1, I2, I3, I4, I5, I6, I7 = IP
+	F0, F1, F2, F3, F4, F5, F6, F7 = FP
+	S0, S1, S2, S3, S4, S5, S6, S7 = SP
+	stages = tuple(tuple(zip(K[::2], K[1::2])) for K in schedules)
+	
+	out = []
+	for b64, in iter_unpack('>Q', data) :
+		b64 = (
+			I0[b64       & 255] | I1[b64 >>  8 & 255] |
+			I2[b64 >> 16 & 255] | I3[b64 >> 24 & 255] |
+			I4[b64 >> 32 & 255] | I5[b64 >> 40 & 255] |
+			I6[b64 >> 48 & 255] | I7[b64 >> 56      ]
+		)
+		l, r = b64 >> 32, b64 & 0xffffffff
 		
-		# Computing key exchange
-		k56, k64 = 0, unpack('>Q', key)[0]
-		for i,j in enumerate(PERMUTED_CHOICE1) :
-			k56 |= (k64 >> 63-j & 1) << 55-i
+		for rounds in stages :
+			for lo, hi in rounds :
+				# E(R): the pieces of R rotated left by 1 start every 4 bits,
+				# 	bit 33 wraps around for the last one
+				e = r << 1 | r >> 31 | (r & 1) << 33
+				a, b = e ^ lo, e >> 4 ^ hi
+				l, r = r, l ^ (
+					S0[a       & 63] ^ S2[a >>  8 & 63] ^
+					S4[a >> 16 & 63] ^ S6[a >> 24 & 63] ^
+					S1[b       & 63] ^ S3[b >>  8 & 63] ^
+					S5[b >> 16 & 63] ^ S7[b >> 24 & 63]
+				)
+			l, r = r, l
 		
-		# get C0, D0
-		C, D = k56 >> 28, k56 & 0xfffffff
+		# IP' exchange
+		b64 = l << 32 | r
+		out.append(pack('>Q',
+			F0[b64       & 255] | F1[b64 >>  8 & 255] |
+			F2[b64 >> 16 & 255] | F3[b64 >> 24 & 255] |
+			F4[b64 >> 32 & 255] | F5[b64 >> 40 & 255] |
+			F6[b64 >> 48 & 255] | F7[b64 >> 56      ]
+		))
+	return b''.join(out)
 
-		for i in ROTATES :
-			# (C, D) <<<= i
-			C = C << i & 0xfffffff | C >> 28-i
-			D = D << i & 0xfffffff | D >> 28-i
-			
-			k48, k56 = 0, C << 28 | D
-			for j,k in enumerate(PERMUTED_CHOICE2) :
-				k48 |= (k56 >> 55-k & 1) << 47-j
-			self.K.append(k48)
+
+# Bitsliced DES
+# Bit j of every block goes into one integer (a "slice"), one bit per block,
+# 	so each boolean operation on slices works on all blocks at once, and
+# 	the bit permutations (IP, FP, E, P) are only a renaming of slices.
+# Python integers have any width: a pass takes up to BITSLICE_LANES blocks.
+
+# From this many bytes on, DES / 3DES blocks go through the bitsliced engine
+BITSLICE_THRESHOLD = 1 << 10
+BITSLICE_LANES = 1 << 14
+
+def _sbox_circuit(box, a, o, M) :
+	# Straight-line code of one S-box over the slices a[0..5] -> o[0..3]:
+	# 	the 16 columns (a1..a4) are decoded into disjoint minterms,
+	# 	every output bit is the OR over the columns of the minterm AND
+	# 	the function of the row bits (a0, a5) that the table wants there
+	src = [
+		'n{0} = {0} ^ {1}'.format(v, M) for v in a[1:5]
+	]
+	for h, (x, y) in enumerate(((a[1], a[2]), (a[3], a[4]))) :
+		for v in range(4) :
+			src.append('p{h}{v} = {0} & {1}'.format(
+				(('n'+x), x)[v & 1], (('n'+y), y)[v >> 1], h=h, v=v))
+	for v in range(16) :
+		src.append('m{0} = p0{1} & p1{2}'.format(v, v & 3, v >> 2))
+	
+	# the 16 functions of two row bits, as the set of rows (bit r) they are 1 on
+	x, y = a[0], a[5]
+	rows = {
+		1: '({x} | {y}) ^ {M}', 2: '{x} & ~{y}', 4: '~{x} & {y}', 8: '{x} & {y}',
+		3: '{y} ^ {M}', 12: '{y}', 5: '{x} ^ {M}', 10: '{x}',
+		6: '{x} ^ {y}', 9: '{x} ^ {y} ^ {M}',
+		7: '({x} & {y}) ^ {M}', 11: '({x} | ~{y}) & {M}', 13: '(~{x} | {y}) & {M}', 14: '{x} | {y}',
+	}
+	used = set()
+	outputs = []
+	for bit in range(4) :
+		terms = []
+		for v in range(16) :
+			# row r is c0 | c5 << 1, column v is c1..c4
+			F = sum((box[r << 4 | v] >> bit & 1) << r for r in range(4))
+			if F == 15 :
+				terms.append('m{}'.format(v))
+			elif F :
+				used.add(F)
+				terms.append('m{} & f{}'.format(v, F))
+		outputs.append('{} = {}'.format(o[bit], ' | '.join(terms) or '0'))
+	src.extend('f{} = {}'.format(F, rows[F].format(x=x, y=y, M=M)) for F in sorted(used))
+	return src + outputs
+
+def _bitslice_round() :
+	# round(L, R, k, M) -> L ^ P(S(E(R) ^ k)), all of them tuples of slices,
+	# 	bit i of a half is slice i, k is the 48 bits of the round key
+	# 	as slices (0 or M), M is the all-ones slice
+	src = [
+		'def round(L, R, k, M) :',
+		'	{} = R'.format(', '.join('r%d' % i for i in range(32))),
+		'	{} = k'.format(', '.join('k%d' % i for i in range(48))),
+	]
+	for n in range(8) :
+		# piece n of E(R) ^ k feeds S-box 8-n, see f() in the table version
+		a = ['a{}_{}'.format(n, t) for t in range(6)]
+		src.extend('	{} = r{} ^ k{}'.format(a[t], EXPANSION[6*n+t], 6*n+t) for t in range(6))
+		o = ['s{}'.format(4*n+m) for m in range(4)]
+		src.extend('	' + line for line in _sbox_circuit(SUBSTITUTION_BOXs[7-n], a, o, 'M'))
+	
+	# res32 bit 31-i = i32 bit 31-P[i], then xor with L
+	inverse = {31-j: 31-i for i,j in enumerate(PERMUTATION)}
+	src.append('	return ({},)'.format(', '.join(
+		'L[{0}] ^ s{1}'.format(i, b) for i,b in sorted(
+			(inverse[b], b) for b in range(32)))))
+	
+	namespace = {}
+	exec('\n'.join(src), namespace)
+	return namespace['round']
+
+_round = None
+
+# Masks of the 64x64 bit transpose, for one matrix (64 words of 64 bits):
+# 	step s swaps bit j of word i with bit j-s of word i+s,
+# 	for every i without and every j with the bit s
+_TRANSPOSE = tuple(
+	(s, b''.join(
+		(0 if i & s else sum(1 << j for j in range(64) if j & s)).to_bytes(8, 'little')
+		for i in range(64)))
+	for s in (32, 16, 8, 4, 2, 1))
+
+def _transpose(x, n) :
+	# Transpose n/64 matrices of 64x64 bits at once, kept in one integer
+	# 	(word i of matrix g = bits 64*(64g+i) ...), it is an involution
+	for s, mask in _TRANSPOSE :
+		m = int.from_bytes(mask * (n >> 6), 'little')
+		t = (x ^ x >> 63*s) & m
+		x ^= t ^ t << 63*s
+	return x
+
+def _key_slices(K, M) :
+	# The 16 round keys as 48 slices each, a key bit 1 is all ones
+	out = []
+	for lo, hi in zip(K[::2], K[1::2]) :
+		k48 = 0
+		for n in range(0, 8, 2) :
+			k48 |= (lo >> 4*n & 63) << 6*n | (hi >> 4*n & 63) << 6*n+6
+		out.append(tuple(M if k48 >> i & 1 else 0 for i in range(48)))
+	return out
+
+def bitslice_crypt_blocks(data, *schedules) :
+	# The same as crypt_blocks, with all blocks of a pass in parallel
+	global _round
+	if _round is None :
+		_round = _bitslice_round()
+	
+	out = []
+	for i in range(0, len(data), BITSLICE_LANES << 3) :
+		chunk = data[i:i+(BITSLICE_LANES << 3)]
+		blocks = len(chunk) >> 3
+		n = blocks + (-blocks & 63) # whole 64x64 matrices
 		
-		self.iK = self.K[::-1]
+		# The blocks as one little-endian integer of 64-bit words,
+		# 	cut into 64 slices of n bits after the transpose.
+		# The arrays only move 8-byte groups, so byte order never matters
+		w = array('Q')
+		w.frombytes(chunk)
+		w.byteswap()
+		w.frombytes(bytes(n - blocks << 3))
+		w = array('Q', _transpose(int.from_bytes(w, 'little'), n).to_bytes(n << 3, 'little'))
+		S = [int.from_bytes(w[j::64], 'little') for j in range(64)]
 		
-		return self
+		M = (1 << n) - 1
+		# IP: bit i = bit IP[i]
+		S = [S[j] for j in INITIAL_PERMUTATION]
+		L, R = tuple(S[32:]), tuple(S[:32])
+		for K in schedules :
+			for k in _key_slices(K, M) :
+				L, R = R, _round(L, R, k, M)
+			L, R = R, L
 		
-	def f(self, i32, k48) :
-		# E exchange and key xor
-		for i,j in enumerate(EXPANSION) :
-			# A Trick That
-			# k48 ^= (i32 >> 31-j & 1) << 47-i
-			k48 ^= (i32 >> j & 1) << i
-		
-		# S-Box exchange
-		# i32 = 0
-		# for i,box in enumerate(SUBSTITUTION_BOXs) :
-		# 	i6 = k48 >> 42 - i*6 # It it not necessary to &0x3f
-		# 	i32 = i32 << 4 | box[i6 >> 1 & 15 | (i6 & 1) << 4 | i6 & 32]
-		i32 = (
-			(SUBSTITUTION_BOX8[k48 >>  1 & 15 | k48 <<  4 & 16 | k48       & 32] |
-			(SUBSTITUTION_BOX7[k48 >>  7 & 15 | k48 >>  2 & 16 | k48 >>  6 & 32] |
-			(SUBSTITUTION_BOX6[k48 >> 13 & 15 | k48 >>  8 & 16 | k48 >> 12 & 32] |
-			(SUBSTITUTION_BOX5[k48 >> 19 & 15 | k48 >> 14 & 16 | k48 >> 18 & 32] |
-			(SUBSTITUTION_BOX4[k48 >> 25 & 15 | k48 >> 20 & 16 | k48 >> 24 & 32] |
-			(SUBSTITUTION_BOX3[k48 >> 31 & 15 | k48 >> 26 & 16 | k48 >> 30 & 32] |
-			(SUBSTITUTION_BOX2[k48 >> 37 & 15 | k48 >> 32 & 16 | k48 >> 36 & 32] |
-			 SUBSTITUTION_BOX1[k48 >> 43 & 15 | k48 >> 38 & 16 | k48 >> 42 & 32] << 4) << 4) << 4) << 4) << 4) << 4) << 4))
-			
-		# P exchange
-		res32 = 0
-		for i,j in enumerate(PERMUTATION) :
-			res32 |= (i32 >> 31-j & 1) << 31-i
+		# FP of L << 32 | R
+		S = R + L
+		S = [S[j] for j in INVERSE_PERMUTATION]
 		
-		return res32
+		for j in range(64) :
+			w[j::64] = array('Q', S[j].to_bytes(n >> 3, 'little'))
+		w = array('Q', _transpose(int.from_bytes(w, 'little'), n).to_bytes(n << 3, 'little'))
+		w.byteswap()
+		out.append(w[:blocks].tobytes())
+	return b''.join(out)
+
+def _crypt(data, *schedules) :
+	if len(data) >= BITSLICE_THRESHOLD :
+		return bitslice_crypt_blocks(data, *schedules)
+	return crypt_blocks(data, *schedules)
+
+
+class DES(BlockCipher) :
+	__slots__ = ('K', 'iK') + BlockCipher.__slots__
+	
+	def __new__(cls, key, mode=BlockCipher.MODE_ECB, iv=None) :
+		self = super().__new__(cls, mode, iv)
+		if len(key) != 8 :
+			raise ValueError('key must be a length 8 bytes.')
 		
-	def encrypt_block(self, block, en=True) :
-		b64, _b64 = 0, unpack('>Q', block)[0]
-		for i,j in enumerate(INITIAL_PERMUTATION) :
-			b64 |= (_b64 >> j & 1) << i
+		self.K, self.iK = self.schedule(key, expand_key)
 		
-		b32l, b32r = b64 >> 32, b64 & 0xffffffff
-		for k in (self.K if en else self.iK) :
-			b32l, b32r = b32r, b32l ^ self.f(b32r, k)
+		return self
 		
-		# IP' exchange
-		b64, _b64 = 0, b32r << 32 | b32l
-		for i,j in enumerate(INVERSE_PERMUTATION) :
-			b64 |= (_b64 >> j & 1) << i
-			
-		return pack('>Q', b64)
+	def encrypt_block(self, block, en=True) :
+		return crypt_blocks(block, self.K if en else self.iK)
 		
 	decrypt_block = lambda self, block: self.encrypt_block(block, False)
 	
+	def encrypt_blocks(self, data) :
+		return _crypt(data, self.K)
+		
+	def decrypt_blocks(self, data) :
+		return _crypt(data, self.iK)
+	
 	block_size = 8
 	
 		
 class TripleDES(DES) :
-	__slots__ = ('encrypt_block', 'decrypt_block') + BlockCipher.__slots__
+	__slots__ = ('des',) + BlockCipher.__slots__
 	
 	# encrypt: C = Ek3(Dk2(Ek1(P)))
 	# decrypt: P = Dk1(EK2(Dk3(C)))
-	def __new__(cls, k1, k2, k3=None, mode=BlockCipher.MODE_ECB, iv=bytes(8)) :
+	def __new__(cls, k1, k2, k3=None, mode=BlockCipher.MODE_ECB, iv=None) :
 		if k3 is None : k3 = k1
 		self = BlockCipher.__new__(cls, mode, iv)
 		
-		d1, d2, d3 = DES(k1), DES(k2), DES(k3)
-		
-		def encrypt_block(data,
-			eb1=d1.encrypt_block,
-			db2=d2.decrypt_block,
-			eb3=d3.encrypt_block,
-		) : return eb3(db2(eb1(data)))
-		
-		def decrypt_block(data,
-			db1=d1.decrypt_block,
-			eb2=d2.encrypt_block,
-			db3=d3.decrypt_block,
-		) : return db1(eb2(db3(data)))
-			
-		self.encrypt_block, self.decrypt_block = (
-			encrypt_block, decrypt_block)
+		# Kept as plain DES objects (not closures), so 3DES can be pickled
+		self.des = d1, d2, d3 = DES(k1), DES(k2), DES(k3)
+		# The 48 rounds of EDE and DED, run by one crypt_blocks
+		self.K = d1.K, d2.iK, d3.K
+		self.iK = d3.iK, d2.K, d1.iK
 			
 		return self
-		
\ No newline at end of file
+		
+	def encrypt_block(self, block) :
+		return crypt_blocks(block, *self.K)
+		
+	def decrypt_block(self, block) :
+		return crypt_blocks(block, *self.iK)
+		
+	def encrypt_blocks(self, data) :
+		return _crypt(data, *self.K)
+		
+	def decrypt_blocks(self, data) :
+		return _crypt(data, *self.iK)
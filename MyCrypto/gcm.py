@@ -0,0 +1,134 @@
+# Galois/Counter Mode (GCM) for 128-bit block ciphers
+# See https://nvlpubs.nist.gov/nistpubs/Legacy/SP/nistspecialpublication800-38d.pdf
+# Also https://csrc.nist.rip/groups/ST/toolkit/BCM/documents/proposedmodes/gcm/gcm-spec.pdf
+#
+# Use it through the cipher:
+# 	AES(key, AES.MODE_GCM, nonce).encrypt_and_digest(data, aad)
+
+from .base import Hash, _blocks, _counter_blocks
+from hmac import compare_digest
+from itertools import repeat
+from struct import pack
+
+# x^128 + x^7 + x^2 + x + 1, in the reflected bit order of GCM
+R = 0xe1 << 120
+
+# Each step runs CTR and GHASH over the same chunk,
+# 	so the data is only walked once
+CHUNK = 1 << 16
+
+def tables(h) :
+	# Shoup's 8-bit tables, one for each byte position:
+	# 	T[i][b] = H * (b << 8*(15-i)), so H*X = T[0][X0] ^ ... ^ T[15][X15]
+	# H * x^k for k in 0..127, multiply by x is a right shift in GCM
+	basis, v = [], h
+	for _ in range(128) :
+		basis.append(v)
+		v = v >> 1 ^ R if v & 1 else v >> 1
+
+	T = []
+	for i in range(16) :
+		t = [0]*256
+		for j in range(8) :
+			bit, hx = 1 << j, basis[8*i + 7-j]
+			for b in range(bit) :
+				t[b | bit] = t[b] ^ hx
+		T.append(t)
+	return tuple(T)
+
+
+class GHASH(Hash) :
+	__slots__ = ('T', 'y')
+
+	def __new__(cls, h: bytes) :
+		self = super().__new__(cls)
+		self.T = tables(int.from_bytes(h, 'big'))
+		self.y = 0
+		return self
+
+	def copy(self) :
+		# The tables are shared, only the accumulator is new
+		other = object.__new__(self.__class__)
+		other.T, other.y = self.T, self.y
+		return other
+
+	def update(self, data) :
+		# Note: every call is zero padded up to a multiple of 16 bytes,
+		# 	as GHASH(A || 0* || C || 0* || len) wants it
+		(T0, T1, T2, T3, T4, T5, T6, T7,
+		 T8, T9, Ta, Tb, Tc, Td, Te, Tf) = self.T
+
+		if len(data) & 15 :
+			data = bytes(data) + bytes(-len(data) & 15)
+
+		y = self.y
+		for x in map(int.from_bytes, _blocks(data, 16), repeat('big')) :
+			y ^= x
+			y = (
+				T0[y >> 120       ] ^ T1[y >> 112 & 255] ^
+				T2[y >> 104 & 255] ^ T3[y >>  96 & 255] ^
+				T4[y >>  88 & 255] ^ T5[y >>  80 & 255] ^
+				T6[y >>  72 & 255] ^ T7[y >>  64 & 255] ^
+				T8[y >>  56 & 255] ^ T9[y >>  48 & 255] ^
+				Ta[y >>  40 & 255] ^ Tb[y >>  32 & 255] ^
+				Tc[y >>  24 & 255] ^ Td[y >>  16 & 255] ^
+				Te[y >>   8 & 255] ^ Tf[y        & 255]
+			)
+		self.y = y
+
+	def digest(self) :
+		return self.y.to_bytes(16, 'big')
+
+
+def _crypt(cipher, data, aad, encrypt) :
+	# The per-key tables are built once and kept by the cipher
+	try :
+		g = cipher.ghash
+	except AttributeError :
+		g = cipher.ghash = GHASH(cipher.encrypt_block(bytes(16)))
+
+	nonce = cipher.iv
+	if len(nonce) == 12 :
+		j0 = int.from_bytes(nonce, 'big') << 32 | 1
+	else :
+		s = g.copy()
+		s.update(nonce)
+		s.update(pack('>QQ', 0, len(nonce) << 3))
+		j0 = s.y
+
+	s = g.copy()
+	s.update(aad)
+
+	# GCTR: only the low 32 bits of the counter block are increased
+	high, low = j0 & ~0xffffffff, j0 + 1 & 0xffffffff
+
+	out, dl = [], len(data)
+	for i in range(0, dl, CHUNK) :
+		chunk = data[i:i+CHUNK]
+		cl = len(chunk)
+		n = -(-cl // 16)
+		ks = cipher.encrypt_blocks(_counter_blocks(high | low, n, 16, False))
+		low = low + n & 0xffffffff
+
+		res = (int.from_bytes(chunk, 'big') ^
+			int.from_bytes(ks, 'big') >> (16*n - cl << 3)).to_bytes(cl, 'big')
+		s.update(res if encrypt else chunk)
+		out.append(res)
+
+	s.update(pack('>QQ', len(aad) << 3, dl << 3))
+	tag = (s.y ^ int.from_bytes(cipher.encrypt_block(j0.to_bytes(16, 'big')), 'big')).to_bytes(16, 'big')
+	return b''.join(out), tag
+
+def encrypt_and_digest(cipher, data, aad=b'') :
+	return _crypt(cipher, data, aad, True)
+
+def decrypt_and_verify(cipher, data, tag, aad=b'') :
+	if not 4 <= len(tag) <= 16 :
+		raise ValueError('GCM tag must be 4 to 16 bytes long, not {}'
+			.format(len(tag)))
+
+	plain, expected = _crypt(cipher, data, aad, False)
+	# The plaintext is never released if the tag is wrong
+	if not compare_digest(expected[:len(tag)], tag) :
+		raise ValueError('MAC check failed')
+	return plain
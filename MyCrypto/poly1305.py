@@ -0,0 +1,112 @@
+# The Poly1305 one-time authenticator, and the ChaCha20-Poly1305 AEAD
+# See https://datatracker.ietf.org/doc/html/rfc8439
+# Also https://cr.yp.to/mac/poly1305-20050329.pdf
+# XChaCha20-Poly1305: https://tools.ietf.org/html/draft-arciszewski-xchacha-03
+#
+# Use it through the cipher:
+# 	ChaCha20(key, nonce).encrypt_and_digest(data, aad)
+# 	(a 24-byte nonce gives XChaCha20-Poly1305)
+
+from .base import Hash, _blocks
+from hmac import compare_digest
+from itertools import repeat
+from operator import mul
+from struct import pack
+
+P = (1 << 130) - 5
+
+# Blocks per reduction: h = (h + m1)r^n + m2 r^(n-1) + ... + mn r, and
+# 	the sum of the products is one C loop over precomputed powers of r
+BATCH = 64
+
+_from_le = lambda blocks: map(int.from_bytes, blocks, repeat('little'))
+
+
+class Poly1305(Hash) :
+	__slots__ = ('r', 's', 'R', 'h', 'buffer')
+
+	def __new__(cls, key: bytes) :
+		# key: 32 bytes, r || s, never use a key twice
+		self = super().__new__(cls)
+		if len(key) != 32 :
+			raise ValueError('Poly1305 key must be 32 bytes long, not {}'
+				.format(len(key)))
+		self.r = int.from_bytes(key[:16], 'little') & 0x0ffffffc0ffffffc0ffffffc0fffffff
+		self.s = int.from_bytes(key[16:], 'little')
+
+		# R = r^BATCH, ..., r^2, r
+		R, x = [], self.r
+		for _ in range(BATCH) :
+			R.append(x)
+			x = x * self.r % P
+		self.R = R[::-1]
+
+		self.h, self.buffer = 0, b''
+		return self
+
+	def copy(self) :
+		other = object.__new__(self.__class__)
+		other.r, other.s, other.R, other.h, other.buffer = (
+			self.r, self.s, self.R, self.h, self.buffer)
+		return other
+
+	def _blocks(self, data) :
+		# data: whole 16-byte blocks, each one gets the 2^128 bit
+		R, h = self.R, self.h
+		step = BATCH << 4
+		for i in range(0, len(data), step) :
+			chunk = data[i:i+step]
+			n = len(chunk) >> 4
+			powers = R[BATCH-n:]
+			h = (h * powers[0] + sum(map(mul, _from_le(_blocks(chunk, 16)), powers))
+				+ (sum(powers) << 128)) % P
+		self.h = h
+
+	def update(self, data) :
+		if self.buffer :
+			data = self.buffer + bytes(data)
+		tail = len(data) & 15
+		self.buffer = bytes(data[len(data)-tail:])
+		if len(data) > tail :
+			self._blocks(data[:len(data)-tail])
+
+	def digest(self) :
+		# the last partial block is padded with a single 1 bit
+		h = self.h
+		if self.buffer :
+			h = (h + int.from_bytes(self.buffer + b'\1', 'little')) * self.r % P
+		return (h + self.s & (1 << 128) - 1).to_bytes(16, 'little')
+
+	def hexdigest(self) :
+		return self.digest().hex()
+
+
+def _mac(otk, aad, crypttext) :
+	# Poly1305(aad || pad16 || crypttext || pad16 || len(aad) || len(crypttext))
+	mac = Poly1305(otk)
+	mac.update(aad)
+	mac.update(bytes(-len(aad) & 15))
+	mac.update(crypttext)
+	mac.update(bytes(-len(crypttext) & 15))
+	mac.update(pack('<QQ', len(aad), len(crypttext)))
+	return mac.digest()
+
+def _check(cipher) :
+	if len(cipher.nonce) not in (12, 24) :
+		raise ValueError('ChaCha20-Poly1305 needs a 12-byte (or 24-byte X) nonce, not {}'
+			.format(len(cipher.nonce)))
+
+def encrypt_and_digest(cipher, data, aad=b'') :
+	# Block 0 gives the one-time key, the data starts at block 1
+	_check(cipher)
+	otk = cipher.crypt_at(0, bytes(32))
+	crypttext = cipher.crypt_at(64, data)
+	return crypttext, _mac(otk, aad, crypttext)
+
+def decrypt_and_verify(cipher, data, tag, aad=b'') :
+	_check(cipher)
+	otk = cipher.crypt_at(0, bytes(32))
+	# The plaintext is never made if the tag is wrong
+	if not compare_digest(_mac(otk, aad, data), tag) :
+		raise ValueError('MAC check failed')
+	return cipher.crypt_at(64, data)
@@ -8,10 +8,52 @@
 
 from .base import StreamCipher
 
+# The PRGA in bulk: out (a bytearray or a writable memoryview) is filled
+# 	in one local loop, S is changed in place, -> the new i, j
+def _prga(S, i, j, out, _bs=0xff) :
+	for k in range(len(out)) :
+		i =  1+i & _bs
+		a = S[i]
+		j =  a+j & _bs
+		b = S[j]
+		S[i], S[j] = b, a
+		out[k] = S[a+b & _bs]
+	return i, j
+
+def _prga_plus(S, i, j, out, _bs=0xff) :
+	for k in range(len(out)) :
+		i =  1+i & _bs
+		a = S[i]
+		j =  a+j & _bs
+		b = S[j]
+		S[i], S[j] = b, a
+		
+		t, ta, tb = (
+			a+b & _bs,
+			S[(i >> 3 ^ j << 5) & _bs]+S[(j >> 3 ^ i << 5) & _bs] ^ 0xAA,
+			j+a & _bs,
+		)
+		out[k] = S[t]+S[ta & _bs] & _bs ^ S[tb]
+	return i, j
+
+def _skip(S, i, j, n, _bs=0xff) :
+	# the PRGA state moves on by n bytes, no output is made
+	for _ in range(n) :
+		i =  1+i & _bs
+		a = S[i]
+		j =  a+j & _bs
+		S[i], S[j] = S[j], a
+	return i, j
+
+
 class RC4(StreamCipher) :
-	__slots__ = ('keystream',)
+	__slots__ = ('S', 'i', 'j', 'mask')
+	
+	_prga = staticmethod(_prga)
 	
-	def __new__(cls, key, *, sbox_size=1<<8) :
+	def __new__(cls, key, *, sbox_size=1<<8, drop=0) :
+		# drop: RC4-drop[n], the first n keystream bytes are thrown away,
+		# 	3072 is usual against the biases of the early output
 		self = super().__new__(cls)
 		if sbox_size & sbox_size-1 :
 			print('sbox_size better be 2^n, otherwise might cause bugs')
@@ -24,25 +66,55 @@ class RC4(StreamCipher) :
 			j = j + S[i] + key[i % _lkey] & _bs
 			S[i], S[j] = S[j], S[i]
 		
-		# PRGA: Pseudo random generation algorithm
-		def stream(i=0, j=0, _bs=_bs, S=S) :
-			S = S[::] # copy S
-			while True:
-				i =    1+i & _bs
-				j = S[i]+j & _bs
-				S[i], S[j] = S[j], S[i]
-			
-				yield S[S[i]+S[j] & _bs]
-				
-		self.keystream = stream
-		
+		self._start(S, _bs, drop)
 		return self
 	
+	def _start(self, S, _bs, drop) :
+		# PRGA: Pseudo random generation algorithm, the state is S, i, j
+		self.S, self.i, self.j, self.mask = S, 0, 0, _bs
+		if drop :
+			self.i, self.j = _skip(S, 0, 0, drop, _bs)
+	
+	def keystream_into(self, buf) :
+		buf = memoryview(buf).cast('B')
+		self.i, self.j = self._prga(self.S, self.i, self.j, buf, self.mask)
+		return len(buf)
+	
+	def keystream_bytes(self, n) :
+		out = bytearray(n)
+		self.i, self.j = self._prga(self.S, self.i, self.j, out, self.mask)
+		return bytes(out)
+	
+	def getstate(self) :
+		# S || i || j
+		return bytes(self.S) + bytes((self.i, self.j))
+	
+	def setstate(self, state) :
+		# The length first: 258 bytes for the default S-box, 2^n + 2 for
+		# 	sbox_size 2^n (at most 256, as getstate packs S, i, j in bytes)
+		n = len(state) - 2
+		if not 2 <= n <= 256 or n & n-1 :
+			raise ValueError('a state of {} is 2^n + 2 bytes (258 for the default S-box), not {}'
+				.format(self.__class__.__name__, len(state)))
+		S, i, j = bytearray(state[:-2]), state[-2], state[-1]
+		if sorted(S) != list(range(n)) or max(i, j) >= n :
+			raise ValueError('not a state of {}'.format(self.__class__.__name__))
+		self.S, self.i, self.j, self.mask = S, i, j, len(S) - 1
+	
+	def keystream(self) :
+		# byte by byte from the position on, the position is not moved
+		S, i, j, out = self.S[:], self.i, self.j, bytearray(256)
+		while True :
+			i, j = self._prga(S, i, j, out, self.mask)
+			yield from out
+	
 
 class RC4P(RC4) :
-	__slots__ = ('keystream',)
+	__slots__ = ()
 	
-	def __new__(cls, key, *, sbox_size=1<<8) :
+	_prga = staticmethod(_prga_plus)
+	
+	def __new__(cls, key, *, sbox_size=1<<8, drop=0) :
 		self = object.__new__(cls)
 		if sbox_size & sbox_size-1 :
 			print('sbox_size better be 2^n, otherwise might cause bugs')
@@ -88,22 +160,5 @@ class RC4P(RC4) :
 			S[i], S[j] = S[j], S[i]
 		
 		# PRGA^+: Pseudo random generation algorithm
-		def stream(i=0, j=0, _bs=_bs, S=S) :
-			S = S[::] # copy S-box
-			while True:
-				i =    1+i & _bs
-				j = S[i]+j & _bs
-				S[i], S[j] = S[j], S[i]
-				
-				t, ta, tb = (
-					S[i]+S[j] & _bs,
-					S[(i >> 3 ^ j << 5) & _bs]+S[(j >> 3 ^ i << 5) & _bs] ^ 0xAA,
-					j+S[j] & _bs,
-				)
-				
-				yield S[t]+S[ta & _bs] & _bs ^ S[tb]
-				
-		self.keystream = stream
-		
+		self._start(S, _bs, drop)
 		return self
-	
\ No newline at end of file
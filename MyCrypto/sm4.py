@@ -2,7 +2,7 @@
 # See GM/T 0002-2012《SM4分组密码算法》
 
 from .base import BlockCipher
-from struct import pack, unpack
+from struct import iter_unpack, pack, unpack
 from array import array
 
 # Expanded SM4 S-boxes	Sbox table: 8bits input convert to 8 bits output
@@ -43,52 +43,74 @@ CK = array('I', (
 def ROT32L(i32, n) :
 	return i32 << n & 0xffffffff | i32 >> 32-n
 
-def F(x1, x2, x3, x4, k, table=Sbox, L=lambda B: \
-	ROT32L(B, 2) ^ ROT32L(B, 10) ^ ROT32L(B, 18) ^ ROT32L(B, 24)
-) :
+# T-tables: S-box merged with the linear transform, like AES's TE1..TE4
+# 	T1[b] = L(Sbox[b] << 24), and L commutes with rotation, so
+# 	T2..T4 are T1 rotated right by 8, 16, 24 bits
+# Rounds use L(B) = B ^ B<<<2 ^ B<<<10 ^ B<<<18 ^ B<<<24
+T1 = array('I', (
+	B ^ ROT32L(B, 2) ^ ROT32L(B, 10) ^ ROT32L(B, 18) ^ ROT32L(B, 24)
+	for B in (i << 24 for i in Sbox)))
+T2 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, T1))
+T3 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, T2))
+T4 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, T3))
+
+# The key schedule uses L'(B) = B ^ B<<<13 ^ B<<<23
+K1 = array('I', (
+	B ^ ROT32L(B, 13) ^ ROT32L(B, 23)
+	for B in (i << 24 for i in Sbox)))
+K2 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, K1))
+K3 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, K2))
+K4 = array('I', map(lambda i: i << 24 & 0xffffffff | i >> 8, K3))
+
+def F(x1, x2, x3, x4, k, T1=T1, T2=T2, T3=T3, T4=T4) :
 	i32 = x2 ^ x3 ^ x4 ^ k
-	B = (
-		table[i32>>24       ] << 24 |
-		table[i32>>16 & 0xff] << 16 |
-		table[i32>> 8 & 0xff] <<  8 |
-		table[i32     & 0xff]
-	)
-	return x1 ^ B ^ L(B)
+	return x1 ^ T1[i32>>24] ^ T2[i32>>16 & 0xff] ^ T3[i32>>8 & 0xff] ^ T4[i32 & 0xff]
+	
+def expand_key(key) :
+	K = array('I') # = 32 bit = 4 bytes
+	w1, w2, w3, w4 = unpack(b'>IIII', key)
+	w1, w2, w3, w4 = w1^FK[0], w2^FK[1], w3^FK[2], w4^FK[3]
+	for i in CK :
+		w1, w2, w3, w4 = \
+			w2, w3, w4, F(w1, w2, w3, w4, i, K1, K2, K3, K4)
+		K.append(w4)
+	
+	return K, K[::-1]
+
+def crypt_blocks(data, K, T1=T1, T2=T2, T3=T3, T4=T4) :
+	# Every round of F inlined, for any number of blocks
+	out = []
+	for w1, w2, w3, w4 in iter_unpack(b'>IIII', data) :
+		for k in K :
+			x = w2 ^ w3 ^ w4 ^ k
+			w1, w2, w3, w4 = w2, w3, w4, \
+				w1 ^ T1[x>>24] ^ T2[x>>16 & 0xff] ^ T3[x>>8 & 0xff] ^ T4[x & 0xff]
+		out.append(pack(b'>IIII', w4, w3, w2, w1))
+	return b''.join(out)
 	
 
 class SM4(BlockCipher) :
 	__slots__ = ('K', 'iK') + BlockCipher.__slots__
 	
-	def __new__(cls, key, mode=BlockCipher.MODE_ECB, iv=bytes(16)) :
+	def __new__(cls, key, mode=BlockCipher.MODE_ECB, iv=None) :
 		self = super().__new__(cls, mode, iv)
 		if len(key) != 16 :
 			raise ValueError('key must be length 16 bytes')
 		
-		self.K = array('I') # = 32 bit = 4 bytes
-		w1, w2, w3, w4 = unpack(b'>IIII', key)
-		w1, w2, w3, w4 = w1^FK[0], w2^FK[1], w3^FK[2], w4^FK[3]
-		for i in CK :
-			w1, w2, w3, w4 = \
-				w2, w3, w4, F(w1, w2, w3, w4, i, L=\
-					lambda B: ROT32L(B, 13) ^ ROT32L(B, 23))
-			self.K.append(w4)
-		
-		self.iK = self.K[::-1]
+		self.K, self.iK = self.schedule(key, expand_key)
 		
 		return self
 		
 	def encrypt_block(self, block) :
-		w1, w2, w3, w4 = unpack(b'>IIII', block)
-		for k in self.K :
-			w1, w2, w3, w4 = \
-				w2, w3, w4, F(w1, w2, w3, w4, k)
-		return pack(b'>IIII', w4, w3, w2, w1)
+		return crypt_blocks(block, self.K)
 		
 	def decrypt_block(self, block) :
-		w1, w2, w3, w4 = unpack(b'>IIII', block)
-		for k in self.iK :
-			w1, w2, w3, w4 = \
-				w2, w3, w4, F(w1, w2, w3, w4, k)
-		return pack(b'>IIII', w4, w3, w2, w1)
+		return crypt_blocks(block, self.iK)
+	
+	def encrypt_blocks(self, data) :
+		return crypt_blocks(data, self.K)
+		
+	def decrypt_blocks(self, data) :
+		return crypt_blocks(data, self.iK)
 	
 	block_size = 16
@@ -3,4 +3,4 @@ from ..chacha20 import ChaCha20
 
 def main() :
 	data, key, nonce = bytes(2048), bytes(32), bytes(12)
-	test('ChaCha20', ChaCha20(key, nonce), data, key)
+	test('ChaCha20', ChaCha20(key, nonce), data, key, decipher=ChaCha20(key, nonce))
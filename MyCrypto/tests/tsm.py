@@ -17,7 +17,9 @@ def pad(b, mup=16) :
 def unpad(b, mup=16) :
 	return b if (len(b) % mup) else b[:-b[-1]]
 
-def test(title, cipher=None, data=None, key=None, prf=e85) :
+def test(title, cipher=None, data=None, key=None, prf=e85, decipher=None) :
+	# decipher: a fresh cipher for the decryption, stream ciphers
+	# 	keep their position, so one object can not decrypt what it encrypted
 	if type(prf) is dict :
 		_ = {
 			'': ...
@@ -36,7 +38,7 @@ def test(title, cipher=None, data=None, key=None, prf=e85) :
 		crypttext = (cipher.encrypt)(data)
 		print('Encrypttext:', prf(crypttext))
 		
-		decrypttext = (cipher.decrypt)(crypttext)
+		decrypttext = (cipher if decipher is None else decipher).decrypt(crypttext)
 		if decrypttext != data :
 			print('Decrypttext:', prf(decrypttext))
 	
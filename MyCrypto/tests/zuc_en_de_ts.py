@@ -3,4 +3,4 @@ from ..zuc import ZUC
 
 def main() :
 	data, key = urandom(127), urandom(16)
-	test('ZUC', ZUC(key), data, key)
\ No newline at end of file
+	test('ZUC', ZUC(key), data, key, decipher=ZUC(key))
\ No newline at end of file
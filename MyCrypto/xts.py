@@ -0,0 +1,164 @@
+# XEX-based Tweaked-codebook mode with ciphertext Stealing (XTS)
+# See IEEE Std 1619-2007, https://doi.org/10.1109/IEEESTD.2008.4493450
+# Also https://nvlpubs.nist.gov/nistpubs/Legacy/SP/nistspecialpublication800-38e.pdf
+#
+# For storage: every data unit (sector) is crypted on its own,
+# 	tweaked by its sector number, so sectors can be crypted
+# 	in any order and by any number of processes.
+#
+# 	xts = XTS(AES, key1 + key2, 4096)
+# 	xts.encrypt(data, sector)
+# 	xts.encrypt_file('disk.img')
+
+from .base import Symmetric, _blocks, _crypt_into, _rebuild, _xor
+from . import _parallel
+from functools import partial
+from itertools import repeat
+from mmap import mmap
+import os
+
+MASK = (1 << 128) - 1
+
+_to_block = partial(int.to_bytes, length=16, byteorder='little')
+
+def _tweaks(t, n) :
+	# T, T*α, T*α^2, ... for the n blocks of one unit,
+	# 	T is a little-endian integer, times α is a left shift
+	# 	reduced by x^128 + x^7 + x^2 + x + 1
+	out = []
+	for _ in range(n) :
+		out.append(t)
+		t = (t << 1 ^ 0x87) & MASK if t >> 127 else t << 1
+	return out
+
+def _xex(fn, data, ks) :
+	# C = E(P ^ T) ^ T, for all blocks at once
+	return _xor(fn(_xor(data, ks)), ks)
+
+def _crypt(xts, sector, data, encrypt) :
+	# The units of data are sector, sector+1, ...
+	# 	only the last one may be shorter than sector_size
+	cipher, su, dl = xts.cipher, xts.sector_size, len(data)
+	fn = cipher.encrypt_blocks if encrypt else cipher.decrypt_blocks
+
+	units = range(0, dl, su)
+	T = map(partial(int.from_bytes, byteorder='little'), _blocks(
+		xts.tweak.encrypt_blocks(b''.join(map(_to_block,
+			range(sector, sector + len(units))))), 16))
+
+	ks, tail = [], None
+	for i, t in zip(units, T) :
+		ul = min(su, dl - i)
+		if ul & 15 : # the last unit only
+			tail = i, ul, t
+			break
+		ks.extend(_tweaks(t, ul >> 4))
+
+	end = len(ks) << 4
+	out = _xex(fn, data[:end], b''.join(map(_to_block, ks))) if ks else b''
+	if tail is None :
+		return out
+
+	# Ciphertext stealing: the last partial block borrows the
+	# 	end of the one before, and the two swap places
+	i, ul, t = tail
+	m, b = ul >> 4, ul & 15
+	ts = list(map(_to_block, _tweaks(t, m + 1)))
+	head = _xex(fn, data[i:i+(m-1 << 4)], b''.join(ts[:m-1])) if m > 1 else b''
+	last, partial_block = data[i+(m-1 << 4):i+(m << 4)], data[i+(m << 4):i+ul]
+	if encrypt :
+		cc = _xex(fn, last, ts[m-1])
+		pp = bytes(partial_block) + cc[b:]
+		return out + head + _xex(fn, pp, ts[m]) + cc[:b]
+	pp = _xex(fn, last, ts[m])
+	cc = bytes(partial_block) + pp[b:]
+	return out + head + _xex(fn, cc, ts[m-1]) + pp[:b]
+
+
+class XTS(Symmetric) :
+	__slots__ = ('cipher', 'tweak', 'sector_size')
+
+	def __new__(cls, algorithm, key, sector_size=512) :
+		# algorithm: a 128-bit BlockCipher class, e.g. AES or SM4
+		# key: key1 || key2, twice the key size of the algorithm
+		# sector_size: bytes of one data unit, 512 and 4096 are usual
+		self = super().__new__(cls)
+		if algorithm.block_size != 16 :
+			raise ValueError('XTS needs a 128-bit block cipher, {} is not'
+				.format(algorithm.__name__))
+		if len(key) & 1 :
+			raise ValueError('XTS key is key1 || key2, its length must be even')
+		if sector_size < 16 or sector_size & 15 :
+			raise ValueError('XTS sector_size must be a multiple of 16 bytes')
+
+		kl = len(key) >> 1
+		if key[:kl] == key[kl:] :
+			raise ValueError('XTS key1 and key2 must not be the same')
+
+		self.cipher = algorithm(key[:kl])
+		self.tweak = algorithm(key[kl:])
+		self.sector_size = sector_size
+		return self
+
+	def __reduce__(self) :
+		# The two ciphers pickle with their key schedules
+		return _rebuild, (self.__class__, tuple(
+			(k, getattr(self, k)) for k in self.__slots__))
+
+	def _check(self, dl) :
+		tail = dl % self.sector_size
+		if dl < 16 or 0 < tail < 16 :
+			raise ValueError('XTS data unit must be at least 16 bytes')
+
+	def crypt(self, data, sector=0, encrypt=True) :
+		# data covers the sectors sector, sector+1, ...
+		dl = len(data)
+		self._check(dl)
+		if not _parallel.enabled(dl) :
+			return _crypt(self, sector, data, encrypt)
+
+		# Sectors are independent, shards are cut on sector bounds
+		su = self.sector_size
+		bounds = _parallel.shards(dl, su)
+		return b''.join(_parallel.pmap(_crypt,
+			repeat(self),
+			(sector + i//su for i,_ in bounds),
+			(bytes(data[i:j]) for i,j in bounds),
+			repeat(encrypt)))
+
+	def encrypt(self, data, sector=0) :
+		return self.crypt(data, sector, True)
+
+	def decrypt(self, data, sector=0) :
+		return self.crypt(data, sector, False)
+
+	def crypt_into(self, src, dst, sector=0, encrypt=True) :
+		# See base._crypt_into, windows are whole sectors
+		src, su = memoryview(src).cast('B'), self.sector_size
+		self._check(len(src))
+		return _crypt_into(lambda i, window : self.crypt(window, sector + i//su, encrypt),
+			src, dst, su)
+
+	def encrypt_into(self, src, dst, sector=0) :
+		return self.crypt_into(src, dst, sector, True)
+
+	def decrypt_into(self, src, dst, sector=0) :
+		return self.crypt_into(src, dst, sector, False)
+
+	def crypt_file(self, path, sector=0, encrypt=True) :
+		# Crypt a whole file (disk image) in place through mmap,
+		# 	sector is the number of its first data unit
+		with open(path, 'r+b') as f :
+			size = os.fstat(f.fileno()).st_size
+			if not size :
+				return 0
+			with mmap(f.fileno(), size) as mm :
+				self.crypt_into(mm, mm, sector, encrypt)
+				mm.flush()
+		return size
+
+	def encrypt_file(self, path, sector=0) :
+		return self.crypt_file(path, sector, True)
+
+	def decrypt_file(self, path, sector=0) :
+		return self.crypt_file(path, sector, False)
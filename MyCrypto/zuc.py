@@ -1,11 +1,25 @@
 # The ZUC Stream Cipher Algorithm
 # See http://www.gsma.com/aboutus/wp-content/uploads/2014/12/eea3eia3zucv16.pdf
 # Also GM/T0001-2012《祖冲之序列密码算法》
-# !!! Unfinished !!!
+#
+# The keystream is made of 32-bit words (big-endian as bytes):
+# 	ZUC(key, iv).keywords(n) or .keystream_bytes(n), .crypt(data)
+#
+# 128-EEA3 and 128-EIA3, the LTE confidentiality and integrity algorithms:
+# See https://www.gsma.com/security/wp-content/uploads/2019/05/EEA3_EIA3_specification_v1_8.pdf
+# 	eea3(key, count, bearer, direction, data, length) -> crypttext
+# 	eia3(key, count, bearer, direction, data, length) -> 4-byte MAC
+# 	length is in bits, the whole data by default
 
-from array import array
+from itertools import chain
+from struct import pack
 from .base import StreamCipher
 
+try :
+	_popcount = int.bit_count
+except AttributeError : # Python < 3.10
+	_popcount = lambda x : bin(x).count('1')
+
 # the s-boxes
 S0 = bytes((
 	0x3e, 0x72, 0x5b, 0x47, 0xca, 0xe0, 0x00, 0x33, 0x04, 0xd1, 0x54, 0x98, 0x09, 0xb9, 0x6d, 0xcb,  
@@ -51,55 +65,147 @@ EK_d = (
 	0x4D78,  0x2F13,  0x6BC4,  0x1AF1,  0x5E26,  0x3C4D,  0x789A,  0x47AC 
 )
 
+# S(x) = S0, S1, S0, S1 on the bytes of x, two lookups of 16-bit halves
+_SH = [S0[x >> 8] << 24 | S1[x & 0xff] << 16 for x in range(1 << 16)]
+_SL = [S0[x >> 8] <<  8 | S1[x & 0xff]       for x in range(1 << 16)]
+
+def _kernel(init) :
+	# clock(s, R1, R2, n) -> (s, R1, R2, words), n clocks of the LFSR and F
+	# 	init: the initialisation mode, W >> 1 is fed back, no words are made
+	# 	else: the work mode, every clock makes Z = W ^ X3
+	#
+	# The LFSR is a ring of 16 local names, clock k writes s16 over the
+	# 	slot of s0, so 16 unrolled clocks bring the names back in place
+	# 	and nothing is ever moved. Sums mod 2^31-1 fold the carries back
+	# 	(2^31 = 1), the result is in [1, 2^31-1] and 2^31-1 stands for 0.
+	src = [
+		'def clock(s, R1, R2, n, M=0xffffffff, P=0x7fffffff, SH=_SH, SL=_SL) :',
+		'	{} = s'.format(', '.join('s%d' % i for i in range(16))),
+		'	out = []; append = out.append',
+		'	while True :',
+	]
+	rot = lambda x, k : '(s{0} << {1} & P | s{0} >> {2})'.format(x, k, 31 - k)
+	for k in range(16) :
+		a = lambda j : (k + j) % 16
+		src += ['		' + line for line in (
+			# bit reorganization
+			'X0 = s{} << 1 & 0xffff0000 | s{} & 0xffff'.format(a(15), a(14)),
+			'X1 = s{} << 16 & M | s{} >> 15'.format(a(11), a(9)),
+			'X2 = s{} << 16 & M | s{} >> 15'.format(a(7), a(5)),
+			# F
+			'W = (X0 ^ R1) + R2 & M',
+			'W1 = R1 + X1 & M',
+			'W2 = R2 ^ X2',
+			'u = W1 << 16 & M | W2 >> 16',
+			'u ^= (u << 2 ^ u << 10 ^ u << 18 ^ u << 24) & M ^ u >> 30 ^ u >> 22 ^ u >> 14 ^ u >> 8',
+			'v = W2 << 16 & M | W1 >> 16',
+			'v ^= (v << 8 ^ v << 14 ^ v << 22 ^ v << 30) & M ^ v >> 24 ^ v >> 18 ^ v >> 10 ^ v >> 2',
+			'R1 = SH[u >> 16] | SL[u & 0xffff]',
+			'R2 = SH[v >> 16] | SL[v & 0xffff]',
+			'W >>= 1' if init else
+			'append(W ^ (s{} << 16 & M | s{} >> 15))'.format(a(2), a(0)),
+			# the LFSR, s16 = 2^15 s15 + 2^17 s13 + 2^21 s10 + 2^20 s4 + (1 + 2^8) s0 (+ W)
+			'v = s{} + {} + {} + {} + {} + {}{}'.format(a(0), rot(a(0), 8), rot(a(4), 20),
+				rot(a(10), 21), rot(a(13), 17), rot(a(15), 15), ' + W' if init else ''),
+			'v = (v & P) + (v >> 31)',
+			's{} = (v & P) + (v >> 31)'.format(a(0)),
+			'n -= 1',
+			'if not n : return ({}), R1, R2, out'.format(
+				''.join('s%d, ' % a(j + 1) for j in range(16))),
+		)]
+	
+	namespace = dict(globals())
+	exec('\n'.join(src), namespace)
+	return namespace['clock']
+
+_init_clock, _clock = _kernel(True), _kernel(False)
+
+
 class ZUC(StreamCipher) :
-	__slots__ = ('keystream', 'iv')
+	__slots__ = ('iv', 'lfsr', 'R1', 'R2', '_buffer')
 	
-	def __new__(cls,  key, iv=bytes(16)) :
+	def __new__(cls, key, iv=bytes(16)) :
+		#  key: 16 byte (128 bit)
+		#   iv: 16 byte (128 bit)
 		self = super().__new__(cls)
+		if len(key) != 16 :
+			raise ValueError('key must be length 16 bytes')
 		if len(iv) != 16 :
 			raise ValueError('iv must be length 16 bytes')
+		self.iv = iv
 		
-		def stream() :
-			S = array('I', bytes(16))
-			X = array('I', bytes(4))
-			R = array('I', bytes(2))
-			
-			def LFSR_init(i31) :
-				v = (S[15] << 15) + (S[13] << 17) + (S[10] << 21) + (S[4] << 20) + (S[0] << 8) + S[0]
-				v = v + i31 % 0x7fffffff
-				if not v : v = 0x7fffffff
-				S.pop(0); S.append(v)
-			
-			def BitReo(S=S) :
-				return (
-					S[15] &   0xffff0000 | S[14] & 0xffff,
-					S[11] & 0xffff << 16 | S[9] >> 16,
-					S[ 7] & 0xffff << 16 | S[5] >> 16,
-					S[ 2] & 0xffff << 16 | S[0] >> 16,
-				)
-				
-			def ROT32L(x, n) :
-				return x << n & 0xffffffff | x >> 32-n
-				
-			def L1(x) :
-				return x ^ ROT31L(x, 2) ^ ROT31L(x, 10) ^ ROT31L(x, 18) ^ ROT31L(x, 24)
-				
-			def L2(x) :
-				return x ^ ROT31L(x, 8) ^ ROT31L(x, 14) ^ ROT31L(x, 22) ^ ROT31L(x, 30)
-				
-			def F(x0, x1, x2, R) :
-				W = (x0 ^ R[0]) + R[1] & 0x7fffffff
-				W1 = R[0] + x1 & 0x7fffffff
-				W2 = R[1] ^ x2
-				
-				R[0] = Sbox[L1(W1&0xffff | W2>>16)]
-				R[1] = Sbox[L2(W2&0xffff | W1>>16)]
-				return W
-				
-			def LFSR_work() :
-				v = (S[15] << 15) + (S[13] << 17) + (S[10] << 21) + (S[4] << 20) + (S[0] << 8) + S[0]
-				v %= 0x7fffffff
-				if not v : v = 0x7fffffff
-				S.pop(0); S.append(v)
-			
+		# s_i = k_i || d_i || iv_i, then 32 clocks of the initialisation mode
+		# 	and one of the work mode, whose word is thrown away
+		s = tuple(k << 23 | d << 8 | v for k, d, v in zip(key, EK_d, iv))
+		s, R1, R2, _ = _init_clock(s, 0, 0, 32)
+		self.lfsr, self.R1, self.R2, _ = _clock(s, R1, R2, 1)
+		self._buffer = b''
 		return self
+	
+	def keywords(self, n) :
+		# the next n keystream words (32-bit ints)
+		if self._buffer :
+			raise ValueError('the keystream is not at a word boundary')
+		if n <= 0 :
+			return []
+		self.lfsr, self.R1, self.R2, out = _clock(self.lfsr, self.R1, self.R2, n)
+		return out
+	
+	def keystream_bytes(self, n) :
+		# whole words are made, the bytes left over wait for the next call
+		buf, self._buffer = self._buffer, b''
+		words = self.keywords(n - len(buf) + 3 >> 2)
+		out = buf + pack('>%dI' % len(words), *words)
+		self._buffer = out[n:]
+		return out[:n]
+	
+	def keystream(self) :
+		# byte by byte from the position on, the position is not moved
+		other = object.__new__(self.__class__)
+		other.lfsr, other.R1, other.R2, other._buffer = self.lfsr, self.R1, self.R2, b''
+		return chain(self._buffer, chain.from_iterable(iter(lambda : other.keystream_bytes(1024), None)))
+
+
+def _bits(data, length) :
+	# -> the first length bits of data as an integer, bit 0 the highest
+	if length is None :
+		length = len(data) << 3
+	if not 0 <= length <= len(data) << 3 :
+		raise ValueError('length must be in [0, {}] bits'.format(len(data) << 3))
+	n = length + 7 >> 3
+	return int.from_bytes(data[:n], 'big') >> (-length & 7), length
+
+def _keyint(key, iv, nwords) :
+	# nwords of keystream as one integer of 32*nwords bits
+	return int.from_bytes(pack('>%dI' % nwords, *ZUC(key, iv).keywords(nwords)), 'big')
+
+def eea3(key, count, bearer, direction, data, length=None) :
+	# count: 32 bit, bearer: 5 bit, direction: 1 bit,
+	# 	the bits after length of the last byte are 0 in the crypttext
+	m, length = _bits(data, length)
+	iv = pack('>IBxxx', count, bearer << 3 | direction << 2) * 2
+	n = length + 31 >> 5
+	ks = _keyint(key, iv, n) >> (n << 5) - length
+	pad = -length & 7
+	return ((m ^ ks) << pad).to_bytes(length + 7 >> 3, 'big')
+
+def eia3(key, count, bearer, direction, data, length=None) :
+	# T = xor of the keystream words z_i at every set bit i of the message,
+	# 	then z_length, MAC = T ^ z_32(L-1)
+	#
+	# Rather than a word per message bit, the keystream slides over the
+	# 	whole message at once: bit t of T is the parity of
+	# 	message & keystream[t:t+length], so any length takes 32 steps
+	# 	of big integer ands and popcounts
+	m, length = _bits(data, length)
+	d = direction << 7
+	iv = pack('>IBxxxIBxBx', count, bearer << 3, count ^ d << 24, bearer << 3, d)
+	n = (length + 31 >> 5) + 2
+	k = _keyint(key, iv, n)
+	top = (n << 5) - length # k >> top - t is the keystream from bit t
+	
+	t = 0
+	for i in range(32) :
+		t = t << 1 | _popcount(m & k >> top - i) & 1
+	t ^= k >> top - 32 & 0xffffffff # z_length
+	return (t ^ k & 0xffffffff).to_bytes(4, 'big')
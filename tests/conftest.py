@@ -0,0 +1,13 @@
+from pytest import fixture
+
+from MyCrypto import _parallel
+
+
+@fixture
+def parallel(monkeypatch) :
+	# A pool of 3 workers from 1 KiB on; set parallel.WORKERS = 1 to
+	# 	compare with the serial path, both are restored afterwards
+	monkeypatch.setattr(_parallel, 'WORKERS', 3)
+	monkeypatch.setattr(_parallel, 'THRESHOLD', 1 << 10)
+	yield _parallel
+	_parallel.shutdown()
@@ -0,0 +1,88 @@
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto import base
+from MyCrypto.aes import AES, expand_key, inverse_key
+
+# Without pycryptodome, unlike test_aes.py
+
+# NIST SP 800-38A, F.1.1 ECB-AES128
+KEY = bytes.fromhex('2b7e151628aed2a6abf7158809cf4f3c')
+PLAIN = bytes.fromhex(
+	'6bc1bee22e409f96e93d7e117393172a'
+	'ae2d8a571e03ac9c9eb76fac45af8e51'
+	'30c81c46a35ce411e5fbc1191a0a52ef'
+	'f69f2445df4f9b17ad2b417be66c3710')
+ECB = bytes.fromhex(
+	'3ad77bb40d7a3660a89ecaf32466ef97'
+	'f5d3d58503b9699de785895a96fdbaaf'
+	'43b1cd7f598ece23881b00e3ed030688'
+	'7b0c785e27e8ad3f8223207104725dd4')
+IV = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+
+
+class TestBlocks :
+
+	def test_fips197(self) :
+		# FIPS-197, Appendix C
+		plain = bytes.fromhex('00112233445566778899aabbccddeeff')
+		for key, crypttext in (
+			('000102030405060708090a0b0c0d0e0f', '69c4e0d86a7b0430d8cdb78070b4c55a'),
+			('000102030405060708090a0b0c0d0e0f1011121314151617', 'dda97ca4864cdfe06eaf70a0ec0d7191'),
+			('000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f', '8ea2b7ca516745bfeafc49904b496089'),
+		) :
+			aes = AES(bytes.fromhex(key))
+			crypttext = bytes.fromhex(crypttext)
+			assert aes.encrypt_blocks(plain*3) == crypttext*3
+			assert aes.decrypt_blocks(crypttext*3) == plain*3
+			assert aes.encrypt_block(plain) == crypttext
+			assert aes.decrypt_block(crypttext) == plain
+
+
+class TestNumPy :
+
+	def test_same_as_python(self, monkeypatch) :
+		from pytest import importorskip
+		importorskip('numpy')
+		from MyCrypto import aes
+		
+		data = urandom(16*300)
+		for kl in (16, 24, 32) :
+			cipher = AES(urandom(kl), AES.MODE_CTR, urandom(16))
+			monkeypatch.setattr(aes, 'NUMPY_THRESHOLD', 16)
+			crypttext = cipher.encrypt_blocks(data), cipher.encrypt(data)
+			assert cipher.decrypt_blocks(crypttext[0]) == data
+			
+			monkeypatch.setattr(aes, 'NUMPY_THRESHOLD', 1 << 62)
+			assert (cipher.encrypt_blocks(data), cipher.encrypt(data)) == crypttext
+
+
+class TestLazyInverse :
+
+	def test_lazy(self) :
+		for kl in (16, 24, 32) :
+			aes = AES(urandom(kl), AES.MODE_CBC, IV)
+			assert not hasattr(aes, '_iK')
+			crypttext = aes.encrypt(PLAIN)
+			assert not hasattr(aes, '_iK')
+			assert aes.decrypt(crypttext) == PLAIN
+
+	def test_cached(self) :
+		base.enable_schedule_cache()
+		try :
+			for kl in (16, 24, 32) :
+				key = urandom(kl)
+				assert AES(key).iK is AES(key).iK
+				assert AES(key).iK == inverse_key(expand_key(key))
+		finally :
+			base.disable_schedule_cache()
+
+	def test_encrypt_only(self) :
+		for mode in (AES.MODE_CTR, AES.MODE_CFB, AES.MODE_OFB) :
+			aes = AES(KEY, mode, IV, encrypt_only=True)
+			assert aes.decrypt(aes.encrypt(PLAIN)) == PLAIN
+		aes = AES(KEY, encrypt_only=True)
+		assert aes.encrypt(PLAIN) == ECB
+		with raises(TypeError) :
+			aes.decrypt(PLAIN)
@@ -0,0 +1,31 @@
+from MyCrypto import bench
+
+
+class TestBench :
+
+	def test_measure(self) :
+		results = bench.run(only={'AES-128', 'CRC32'}, sizes=(16, 64),
+			min_time=0.001, setup_rounds=1, latency_calls=3)
+		assert set(results['results']) == {'AES-128', 'CRC32'}
+		for r in results['results'].values() :
+			assert set(r['throughput_MBps']) == {'16', '64'}
+			assert set(r['latency_us']) == {'p50', 'p90', 'p99'}
+			assert r['setup_us'] >= 0
+		assert bench.compare(results, results) == []
+
+	def test_prng(self) :
+		names = {'Xorshift32', 'Xorshift64', 'Xorshift64h', 'Xorshift64s',
+			'Xorshift128', 'Xorshift128p', 'Xorshift1024s', 'isaac'}
+		results = bench.run(only=names, sizes=(64,), min_time=0, setup_rounds=1, latency_calls=1)
+		assert set(results['results']) == names
+
+	def test_compare(self) :
+		old = {'results': {'AES': {'setup_us': 10, 'throughput_MBps': {'64': 1.0},
+			'latency_us': {'p50': 5, 'p99': 8}}}}
+		new = {'results': {'AES': {'setup_us': 10.5, 'throughput_MBps': {'64': 0.8},
+			'latency_us': {'p50': 5, 'p99': 9}}}}
+		assert [(m, o, n) for _, m, o, n in bench.compare(old, new, 0.1)] == [
+			('throughput_MBps[64]', 1.0, 0.8), ('latency_us[p99]', 8, 9)]
+		assert bench.compare(old, new, 0.3) == []
+		
+		assert bench.main(['--only', 'CRC16', '--sizes', '8', '--min-time', '0']) == 0
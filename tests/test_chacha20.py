@@ -0,0 +1,168 @@
+from itertools import islice
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto import chacha20
+from MyCrypto.base import _xor
+from MyCrypto.chacha20 import ChaCha20
+
+# RFC 8439, 2.4.2
+KEY = bytes(range(32))
+NONCE = bytes.fromhex('000000000000004a00000000')
+PLAIN = (b"Ladies and Gentlemen of the class of '99: If I could offer you "
+	b"only one tip for the future, sunscreen would be it.")
+CIPHER = bytes.fromhex(
+	'6e2e359a2568f98041ba0728dd0d6981e97e7aec1d4360c20a27afccfd9fae0b'
+	'f91b65c5524733ab8f593dabcd62b3571639d624e65152ab8f530c359f0861d8'
+	'07ca0dbf500d6a6156a38e088a22b65e52bc514d16ccf806818ce91ab7793736'
+	'5af90bbf74a35be6b40b8eedf2785e42874d')
+
+
+class TestChaCha20 :
+
+	def test_keystream(self) :
+		# RFC 8439, A.1 test vectors 1 and 2: blocks 0 and 1
+		cipher = ChaCha20(bytes(32), bytes(12))
+		ks = bytes.fromhex(
+			'76b8e0ada0f13d90405d6ae55386bd28bdd219b8a08ded1aa836efcc8b770dc7'
+			'da41597c5157488d7724e03fb8d84a376a43b8f41518a11cc387b669b2ee6586'
+			'9f07e7be5551387a98ba977c732d080dcb0f29a048e3656912c6533e32ee7aed'
+			'29b721769ce64e43d57133b074d839d531ed1f28510afb45ace10a1f4b794d6f')
+		assert next(cipher.keyblocks(2)) == ks
+		assert bytes(islice(cipher.keystream(), 128)) == ks
+		assert cipher.crypt(bytes(128)) == ks
+		# the original 64-bit nonce and counter, the same blocks when all zero
+		assert ChaCha20(bytes(32), bytes(8)).crypt(bytes(128)) == ks
+
+	def test_sunscreen(self) :
+		# the vector starts at block 1
+		cipher = ChaCha20(KEY, NONCE)
+		assert cipher.encrypt(bytes(64) + PLAIN)[64:] == CIPHER
+		cipher.seek(0)
+		assert cipher.decrypt(bytes(64) + CIPHER)[64:] == PLAIN
+
+	def test_chunks(self, monkeypatch) :
+		cipher = ChaCha20(urandom(32), urandom(12))
+		data = urandom(1000)
+		crypttext = cipher.crypt(data)
+		cipher.seek(0)
+		assert bytes(cipher.itercrypt(data)) == crypttext
+		monkeypatch.setattr(chacha20, 'CHUNK', 128)
+		cipher.seek(0)
+		assert cipher.crypt(data) == crypttext
+
+	def test_seek(self) :
+		cipher = ChaCha20(KEY, NONCE)
+		for offset in (64, 70, 127) :
+			assert cipher.crypt_at(offset, PLAIN[offset-64:]) == CIPHER[offset-64:]
+		cipher.seek(64)
+		assert cipher.tell() == 64
+		assert next(cipher.keyblocks()) == _xor(PLAIN[:64], CIPHER[:64])
+		assert cipher.crypt(PLAIN) == CIPHER
+		assert cipher.tell() == 64 + len(PLAIN)
+		cipher.seek(100)
+		assert bytes(islice(cipher.keystream(), 14)) == _xor(PLAIN[36:50], CIPHER[36:50])
+		cipher.nonce = NONCE
+		assert cipher.tell() == 0
+
+	def test_pieces(self) :
+		# the position moves on with every call
+		cipher = ChaCha20(KEY, NONCE)
+		cipher.seek(64)
+		pieces = (0, 1, 63, 64, 100, len(PLAIN))
+		assert b''.join(cipher.crypt(PLAIN[i:j]) for i,j in zip(pieces, pieces[1:])) == CIPHER
+		cipher.seek(64)
+		assert cipher.keystream_bytes(10) + cipher.keystream_bytes(len(PLAIN)-10) == _xor(PLAIN, CIPHER)
+		cipher.seek(64)
+		buf = bytearray(len(PLAIN))
+		assert cipher.keystream_into(buf) == len(PLAIN)
+		assert _xor(buf, PLAIN) == CIPHER and cipher.tell() == 64 + len(PLAIN)
+
+	def test_counter_end(self) :
+		# no wrap around of the block counter, the keystream would be reused
+		for nonce, end in ((urandom(12), 64 << 32), (urandom(24), 64 << 32), (urandom(8), 64 << 64)) :
+			cipher = ChaCha20(urandom(32), nonce)
+			last = cipher.crypt_at(end - 100, bytes(100))
+			cipher.seek(end - 64)
+			assert b''.join(cipher.keyblocks(16)) == last[36:]
+			cipher.seek(end - 100)
+			assert cipher.keystream_bytes(100) == last
+			cipher.seek(end)
+			with raises(ValueError) :
+				cipher.crypt(b'x')
+			with raises(ValueError) :
+				cipher.keyblocks()
+			with raises(ValueError) :
+				cipher.keystream_bytes(1)
+			with raises(ValueError) :
+				cipher.seek(end + 1)
+			with raises(ValueError) :
+				cipher.crypt_at(end - 10, bytes(11))
+		with raises(ValueError) :
+			ChaCha20(KEY, NONCE).crypt_at(64 << 32, PLAIN)
+
+	def test_parallel(self, parallel) :
+		cipher = ChaCha20(urandom(32), urandom(8))
+		data = urandom(5000)
+		crypttext = cipher.crypt_at(1000, data)
+		parallel.WORKERS = 1
+		assert cipher.crypt_at(1000, data) == crypttext
+		assert cipher.crypt(bytes(1000) + data)[1000:] == crypttext
+
+	def test_numpy(self, monkeypatch) :
+		from pytest import importorskip
+		importorskip('numpy')
+		state = tuple(range(16))
+		for counter in (0, (1 << 32) - 3) : # the counter wraps into word 13
+			for wide in (False, True) :
+				assert chacha20._numpy_blocks(state, counter, 7, wide) == \
+					chacha20.blocks(state, counter, 7, wide)
+		
+		cipher = ChaCha20(urandom(32), urandom(12))
+		data = urandom(5000)
+		monkeypatch.setattr(chacha20, 'NUMPY_THRESHOLD', 64)
+		crypttext = cipher.crypt_at(100, data)
+		monkeypatch.setattr(chacha20, 'NUMPY_THRESHOLD', 1 << 62)
+		assert cipher.crypt_at(100, data) == crypttext
+
+	def test_xchacha_reuse(self) :
+		# the nonce setter must not replace the key by the HChaCha20 subkey
+		key, nonce = urandom(32), urandom(24)
+		cipher = ChaCha20(key, nonce)
+		crypttext = cipher.crypt(PLAIN)
+		cipher.nonce = nonce
+		assert cipher.crypt(PLAIN) == crypttext
+		assert ChaCha20(key, nonce).crypt(PLAIN) == crypttext
+		assert cipher.nonce == nonce
+
+	def test_many(self, monkeypatch) :
+		key = KEY
+		cipher = ChaCha20(key, NONCE)
+		packets = [(urandom(n), urandom(l)) for n, l in
+			((12, 0), (12, 1), (8, 64), (24, 100), (12, 1500), (24, 3000))]
+		expected = [ChaCha20(key, n).crypt(d) for n, d in packets]
+		assert cipher.encrypt_many(packets) == expected
+		monkeypatch.setattr(chacha20, 'NUMPY_THRESHOLD', 64)
+		if chacha20.np is not None :
+			assert cipher.encrypt_many(packets) == expected
+		assert cipher.decrypt_many(zip((n for n,_ in packets), expected)) == [d for _,d in packets]
+		# the cipher itself is left as it was
+		assert cipher.nonce == NONCE and cipher.tell() == 0
+		assert cipher.encrypt(bytes(64) + PLAIN)[64:] == CIPHER
+
+	def test_state(self) :
+		for nonce in (urandom(8), NONCE, urandom(24)) :
+			cipher = ChaCha20(KEY, nonce)
+			crypttext = cipher.crypt(PLAIN)
+			cipher.seek(77)
+			state = cipher.getstate()
+			assert len(state) == 40 + len(nonce)
+			other = ChaCha20.from_state(state)
+			assert other.nonce == nonce and other.tell() == 77
+			assert other.crypt(PLAIN[77:]) == crypttext[77:]
+			cipher.nonce = urandom(12)
+			cipher.setstate(state)
+			assert cipher.crypt(PLAIN[77:]) == crypttext[77:]
+		with raises(ValueError) :
+			ChaCha20.from_state(bytes(41))
@@ -0,0 +1,43 @@
+from os import urandom
+
+from MyCrypto import des
+from MyCrypto.des import DES, TripleDES
+
+
+class TestBlocks :
+
+	def test_des(self) :
+		cipher = DES(bytes.fromhex('133457799bbcdff1'))
+		plain, crypttext = bytes.fromhex('0123456789abcdef'), bytes.fromhex('85e813540f0ab405')
+		assert cipher.encrypt_blocks(plain*2) == crypttext*2
+		assert cipher.decrypt_block(crypttext) == plain
+	
+	def test_triple_des(self) :
+		# NIST SP 800-67, the 3-key example
+		tdes = TripleDES(*map(bytes.fromhex, ('0123456789abcdef', '23456789abcdef01', '456789abcdef0123')))
+		plain = b'The qufck brown fox jump' # sic
+		crypttext = bytes.fromhex('a826fd8ce53b855fcce21c8112256fe668d5c05dd9b6b900')
+		assert tdes.encrypt_blocks(plain) == crypttext
+		assert tdes.decrypt_blocks(crypttext) == plain
+		assert tdes.encrypt_block(plain[:8]) == crypttext[:8]
+
+
+class TestBitslice :
+
+	def test_same_as_table(self, monkeypatch) :
+		monkeypatch.setattr(des, 'BITSLICE_LANES', 128) # several passes
+		tdes = TripleDES(urandom(8), urandom(8), urandom(8))
+		for schedules in ((DES(urandom(8)).K,), tdes.K, tdes.iK) :
+			for n in (1, 64, 65, 300) :
+				data = urandom(8*n)
+				assert des.bitslice_crypt_blocks(data, *schedules) == \
+					des.crypt_blocks(data, *schedules)
+		
+	def test_modes(self, monkeypatch) :
+		for mode, data in ((DES.MODE_CTR, urandom(1605)), (DES.MODE_CBC, urandom(1600))) :
+			tdes = TripleDES(urandom(8), urandom(8), urandom(8), mode, urandom(8))
+			crypttext = tdes.encrypt(data)
+			monkeypatch.setattr(des, 'BITSLICE_THRESHOLD', 1 << 62)
+			assert tdes.encrypt(data) == crypttext
+			monkeypatch.setattr(des, 'BITSLICE_THRESHOLD', 8)
+			assert tdes.decrypt(crypttext) == data
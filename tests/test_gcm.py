@@ -0,0 +1,101 @@
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto.aes import AES
+from MyCrypto.sm4 import SM4
+
+# The Galois/Counter Mode of Operation (GCM), Appendix B
+# 	(key, iv, plaintext, aad, ciphertext, tag)
+K3 = 'feffe9928665731c6d6a8f9467308308'
+P3 = (
+	'd9313225f88406e5a55909c5aff5269a'
+	'86a7a9531534f7da2e4c303d8a318a72'
+	'1c3c0c95956809532fcf0e2449a6b525'
+	'b16aedf5aa0de657ba637b391aafd255')
+P4 = P3[:120]
+A4 = 'feedfacedeadbeeffeedfacedeadbeefabaddad2'
+VECTORS = tuple(tuple(map(bytes.fromhex, i)) for i in (
+	( # Test Case 1
+		'00000000000000000000000000000000', '000000000000000000000000', '', '',
+		'', '58e2fccefa7e3061367f1d57a4e7455a'),
+	( # Test Case 2
+		'00000000000000000000000000000000', '000000000000000000000000',
+		'00000000000000000000000000000000', '',
+		'0388dace60b6a392f328c2b971b2fe78', 'ab6e47d42cec13bdf53a67b21257bddf'),
+	( # Test Case 3
+		K3, 'cafebabefacedbaddecaf888', P3, '',
+		'42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e'
+		'21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091473f5985',
+		'4d5c2af327cd64a62cf35abd2ba6fab4'),
+	( # Test Case 4
+		K3, 'cafebabefacedbaddecaf888', P4, A4,
+		'42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e'
+		'21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091',
+		'5bc94fbc3221a5db94fae95ae7121a47'),
+	( # Test Case 5, 64-bit iv
+		K3, 'cafebabefacedbad', P4, A4,
+		'61353b4c2806934a777ff51fa22a4755699b2a714fcdc6f83766e5f97b6c7423'
+		'73806900e49f24b22b097544d4896b424989b5e1ebac0f07c23f4598',
+		'3612d2e79e3b0785561be14aaca2fccb'),
+	( # Test Case 6, 480-bit iv
+		K3,
+		'9313225df88406e555909c5aff5269aa6a7a9538534f7da1e4c303d2a318a728'
+		'c3c0c95156809539fcf0e2429a6b525416aedbf5a0de6a57a637b39b',
+		P4, A4,
+		'8ce24998625615b603a033aca13fb894be9112a5c3a211a8ba262a3cca7e2ca7'
+		'01e4a9a4fba43c90ccdcb281d48c7c6fd62875d2aca417034c34aee5',
+		'619cc5aefffe0bfa462af43c1699d050'),
+))
+
+
+class TestGCM :
+
+	def test_vectors(self) :
+		for key, iv, plain, aad, crypttext, tag in VECTORS :
+			aes = AES(key, AES.MODE_GCM, iv)
+			assert aes.encrypt_and_digest(plain, aad) == (crypttext, tag)
+			assert aes.decrypt_and_verify(crypttext, tag, aad) == plain
+
+	def test_tampered(self) :
+		key, iv, plain, aad, crypttext, tag = VECTORS[3]
+		aes = AES(key, AES.MODE_GCM, iv)
+		with raises(ValueError) :
+			aes.decrypt_and_verify(crypttext, tag, aad[:-1])
+		with raises(ValueError) :
+			aes.decrypt_and_verify(b'\0' + crypttext[1:], tag, aad)
+		assert aes.decrypt_and_verify(crypttext, tag[:12], aad) == plain
+
+	def test_long(self, monkeypatch) :
+		from MyCrypto import gcm
+		data, aad = urandom(1001), urandom(33)
+		sm4 = SM4(urandom(16), SM4.MODE_GCM, urandom(12))
+		crypttext, tag = sm4.encrypt_and_digest(data, aad)
+		monkeypatch.setattr(gcm, 'CHUNK', 48)
+		assert gcm.encrypt_and_digest(sm4, data, aad) == (crypttext, tag)
+		assert sm4.decrypt_and_verify(crypttext, tag, aad) == data
+
+	def test_nonce_required(self) :
+		for cls in (AES, SM4) :
+			with raises(ValueError) :
+				cls(bytes(16), cls.MODE_GCM)
+
+	def test_nonce_reuse(self) :
+		aes = AES(urandom(16), AES.MODE_GCM, bytes(12))
+		crypttext, tag = aes.encrypt_and_digest(b'first')
+		with raises(ValueError) :
+			aes.encrypt_and_digest(b'second')
+		# decryption may be repeated, a new nonce may encrypt again
+		assert aes.decrypt_and_verify(crypttext, tag) == b'first'
+		assert aes.decrypt_and_verify(crypttext, tag) == b'first'
+		aes.iv = urandom(12)
+		aes.encrypt_and_digest(b'second')
+		aes.iv = bytes(12)
+		with raises(ValueError) :
+			aes.encrypt_and_digest(b'third')
+
+	def test_wrong_mode(self) :
+		with raises(ValueError) :
+			AES(bytes(16), AES.MODE_GCM, bytes(12)).encrypt(bytes(16))
+		with raises(ValueError) :
+			AES(bytes(16)).encrypt_and_digest(bytes(16))
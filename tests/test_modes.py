@@ -0,0 +1,225 @@
+from array import array
+from mmap import mmap
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto import base
+from MyCrypto.aes import AES
+from MyCrypto.des import TripleDES
+from MyCrypto.sm4 import SM4
+
+# NIST SP 800-38A
+KEY = bytes.fromhex('2b7e151628aed2a6abf7158809cf4f3c')
+PLAIN = bytes.fromhex(
+	'6bc1bee22e409f96e93d7e117393172a'
+	'ae2d8a571e03ac9c9eb76fac45af8e51'
+	'30c81c46a35ce411e5fbc1191a0a52ef'
+	'f69f2445df4f9b17ad2b417be66c3710')
+IV = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+# F.1.1, F.2.1, F.3.13, F.4.1
+VECTORS = {
+	AES.MODE_ECB: bytes.fromhex(
+		'3ad77bb40d7a3660a89ecaf32466ef97'
+		'f5d3d58503b9699de785895a96fdbaaf'
+		'43b1cd7f598ece23881b00e3ed030688'
+		'7b0c785e27e8ad3f8223207104725dd4'),
+	AES.MODE_CBC: bytes.fromhex(
+		'7649abac8119b246cee98e9b12e9197d'
+		'5086cb9b507219ee95db113a917678b2'
+		'73bed6b8e3c1743b7116e69e22229516'
+		'3ff1caa1681fac09120eca307586e1a7'),
+	AES.MODE_CFB: bytes.fromhex(
+		'3b3fd92eb72dad20333449f8e83cfb4a'
+		'c8a64537a0b3a93fcde3cdad9f1ce58b'
+		'26751f67a3cbb140b1808cf187a4f4df'
+		'c04b05357c5d1c0eeac4c66f9ff7f2e6'),
+	AES.MODE_OFB: bytes.fromhex(
+		'3b3fd92eb72dad20333449f8e83cfb4a'
+		'7789508d16918f03f53c52dac54ed825'
+		'9740051e9c5fecf64344f7a82260edcc'
+		'304c6528f659c77866a510d9c1d6ae5e'),
+}
+# F.5.1 CTR-AES128
+CTR_IV = bytes.fromhex('f0f1f2f3f4f5f6f7f8f9fafbfcfdfeff')
+CTR_CIPHER = bytes.fromhex(
+	'874d6191b620e3261bef6864990db6ce'
+	'9806f66b7970fdff8617187bb9fffdff'
+	'5ae4df3edbd5d35e5b4f09020db03eab'
+	'1e031dda2fbe03d1792170a0f3009cee')
+
+
+class TestCTR :
+
+	def test_nist(self) :
+		aes = AES(KEY, AES.MODE_CTR, CTR_IV)
+		assert aes.encrypt(PLAIN) == CTR_CIPHER
+		assert aes.decrypt(CTR_CIPHER) == PLAIN
+
+	def test_counter_required(self) :
+		# no default counter block, it would be the same for every message
+		for cipher in (lambda *a : AES(KEY, *a), lambda *a : SM4(KEY, *a),
+			lambda *a : TripleDES(KEY[:8], KEY[8:], KEY[:8], *a)) :
+			with raises(ValueError) :
+				cipher(AES.MODE_CTR)
+			assert not any(cipher(AES.MODE_CBC).iv) # the other modes keep theirs
+
+	def test_partial_block(self) :
+		aes = AES(KEY, AES.MODE_CTR, CTR_IV)
+		assert aes.encrypt(PLAIN[:37]) == CTR_CIPHER[:37]
+
+	def test_parallel(self, parallel) :
+		data = urandom(10007)
+		for cipher in (
+			AES(urandom(32), AES.MODE_CTR, urandom(16)),
+			SM4(urandom(16), SM4.MODE_CTR, urandom(16)),
+			# counter wraps around inside the first shard
+			TripleDES(urandom(8), urandom(8), urandom(8), TripleDES.MODE_CTR, b'\xff'*8),
+		) :
+			crypttext = cipher.encrypt(data)
+			parallel.WORKERS = 1
+			assert cipher.encrypt(data) == crypttext
+			assert cipher.decrypt(crypttext) == data
+			parallel.WORKERS = 3
+
+	def test_counter_blocks(self, monkeypatch) :
+		ref = lambda c, n, bs, carry : b''.join(
+			(c + i & (1 << 8*bs) - 1 if carry else c & ~0xffffffff | c + i & 0xffffffff)
+			.to_bytes(bs, 'big') for i in range(n))
+		for numpy in (base.np, None) :
+			monkeypatch.setattr(base, 'np', numpy)
+			for bs in (8, 16) :
+				for c in (0, 0xfffffffd, (1 << 8*bs) - 3, int.from_bytes(urandom(bs), 'big')) :
+					for carry in (True, False) :
+						assert base._counter_blocks(c, 7, bs, carry) == ref(c, 7, bs, carry)
+
+
+class TestCBC :
+
+	def test_parallel_decrypt(self, parallel) :
+		data = urandom(16*641)
+		for cipher in (
+			AES(urandom(16), AES.MODE_CBC, urandom(16)),
+			SM4(urandom(16), SM4.MODE_CBC, urandom(16)),
+			TripleDES(urandom(8), urandom(8), urandom(8), TripleDES.MODE_CBC, urandom(8)),
+		) :
+			crypttext = cipher.encrypt(data)
+			assert cipher.decrypt(crypttext) == data
+			
+			buf = bytearray(crypttext)
+			cipher.decrypt_into(buf, buf)
+			assert buf == data
+			
+			parallel.WORKERS = 1
+			assert cipher.decrypt(crypttext) == data
+			parallel.WORKERS = 3
+
+
+class TestModes :
+
+	def test_nist(self) :
+		for mode, crypttext in VECTORS.items() :
+			aes = AES(KEY, mode, IV)
+			assert aes.encrypt(PLAIN) == crypttext
+			assert aes.decrypt(crypttext) == PLAIN
+
+	def test_context(self) :
+		for mode, crypttext in VECTORS.items() :
+			aes = AES(KEY, mode, IV)
+			for n in (1, 7, 16, 33) :
+				ctx = aes.encryptor()
+				assert b''.join(
+					ctx.update(PLAIN[i:i+n]) for i in range(0, len(PLAIN), n)
+				) + ctx.finalize() == crypttext
+				
+				ctx = aes.decryptor()
+				assert b''.join(
+					ctx.update(memoryview(crypttext)[i:i+n]) for i in range(0, len(PLAIN), n)
+				) + ctx.finalize() == PLAIN
+
+	def test_stream_modes_tail(self) :
+		data = urandom(1001)
+		for mode in (SM4.MODE_CFB, SM4.MODE_OFB, SM4.MODE_CTR) :
+			sm4 = SM4(urandom(16), mode, urandom(16))
+			crypttext = sm4.encrypt(data)
+			assert b''.join(sm4.itercrypt(
+				(data[i:i+100] for i in range(0, len(data), 100)))) == crypttext
+			assert sm4.decrypt(crypttext) == data
+
+	def test_itercrypt_compat(self) :
+		# itercrypt(data, block_function) as before the contexts
+		aes = AES(KEY, AES.MODE_CBC, IV)
+		crypttext = b''.join(aes.itercrypt(PLAIN, aes.encrypt_block))
+		assert crypttext == VECTORS[AES.MODE_CBC]
+		assert b''.join(aes.itercrypt(crypttext, aes.decrypt_block)) == PLAIN
+		assert b''.join(aes.itercrypt([crypttext[:20], crypttext[20:]], False)) == PLAIN
+
+	def test_finalize(self) :
+		ctx = AES(KEY, AES.MODE_CBC, IV).encryptor()
+		ctx.update(PLAIN[:20])
+		with raises(ValueError) :
+			ctx.finalize()
+		with raises(ValueError) :
+			ctx.update(PLAIN)
+
+
+class TestInto :
+
+	def test_in_place(self, monkeypatch) :
+		monkeypatch.setattr(base, '_WINDOW', 48)
+		for mode, crypttext in VECTORS.items() :
+			aes = AES(KEY, mode, IV)
+			for buf in (bytearray(PLAIN), array('I', PLAIN)) :
+				assert aes.encrypt_into(buf, buf) == len(PLAIN)
+				assert bytes(buf) == crypttext
+				aes.decrypt_into(buf, buf)
+				assert bytes(buf) == PLAIN
+
+	def test_mmap(self) :
+		data = urandom(1001)
+		sm4 = SM4(urandom(16), SM4.MODE_CTR, urandom(16))
+		mm = mmap(-1, len(data))
+		sm4.encrypt_into(data, mm)
+		assert mm[:] == sm4.encrypt(data)
+		sm4.decrypt_into(mm, memoryview(mm))
+		assert mm[:] == data
+
+	def test_bad_buffer(self) :
+		aes = AES(KEY, AES.MODE_ECB)
+		with raises(ValueError) :
+			aes.encrypt_into(PLAIN, bytearray(16))
+		with raises(ValueError) :
+			aes.encrypt_into(PLAIN[:20], bytearray(20))
+
+
+class TestBlocks :
+
+	def test_same_as_block(self) :
+		data = urandom(16*20)
+		for cipher in (AES(urandom(24)), SM4(urandom(16)), TripleDES(urandom(8), urandom(8))) :
+			bs = cipher.block_size
+			assert cipher.encrypt_blocks(data) == b''.join(
+				cipher.encrypt_block(data[i:i+bs]) for i in range(0, len(data), bs))
+			assert cipher.decrypt_blocks(cipher.encrypt_blocks(data)) == data
+
+
+class TestScheduleCache :
+
+	def test_lru(self) :
+		cache = base.enable_schedule_cache(2)
+		try :
+			keys = [urandom(16) for _ in range(3)]
+			aes = AES(keys[0])
+			assert AES(keys[0]).K is aes.K
+			SM4(keys[0]) # another algorithm, another entry
+			AES(keys[1])
+			assert base.schedule_cache_info() == (1, 3, 2, 2)
+			
+			AES(keys[0]) # evicted by AES(keys[1])
+			assert cache.info().misses == 4
+			assert AES(KEY).encrypt(PLAIN) == VECTORS[AES.MODE_ECB]
+			assert AES(KEY).encrypt(PLAIN) == VECTORS[AES.MODE_ECB]
+			assert cache.info().hits == 2
+		finally :
+			base.disable_schedule_cache()
+		assert base.schedule_cache_info() is None
@@ -0,0 +1,33 @@
+from concurrent.futures.process import BrokenProcessPool
+from operator import add
+
+from MyCrypto import _parallel
+
+
+class _Broken :
+
+	def map(self, *args) :
+		raise BrokenProcessPool('a worker could not start')
+
+
+class TestParallel :
+
+	def test_opt_in(self) :
+		assert _parallel.WORKERS == 1
+		assert not _parallel.enabled(1 << 30)
+
+	def test_rebuild(self, monkeypatch) :
+		monkeypatch.setattr(_parallel, 'WORKERS', 2)
+		pool = _parallel.executor()
+		assert _parallel.executor() is pool
+		monkeypatch.setattr(_parallel, 'WORKERS', 3)
+		assert _parallel.executor()._max_workers == 3
+		assert list(_parallel.pmap(add, range(5), range(5))) == [0, 2, 4, 6, 8]
+		_parallel.shutdown()
+
+	def test_broken_pool(self, monkeypatch) :
+		monkeypatch.setattr(_parallel, 'WORKERS', 3)
+		monkeypatch.setattr(_parallel, '_executor', _Broken())
+		monkeypatch.setattr(_parallel, 'executor', lambda : _parallel._executor)
+		assert _parallel.pmap(add, iter(range(5)), range(5)) == [0, 2, 4, 6, 8]
+		assert _parallel._executor is None
@@ -0,0 +1,71 @@
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto import poly1305
+from MyCrypto.chacha20 import ChaCha20
+from MyCrypto.poly1305 import Poly1305
+
+# RFC 8439, 2.8.2
+KEY = bytes(range(0x80, 0xa0))
+NONCE = bytes.fromhex('070000004041424344454647')
+AAD = bytes.fromhex('50515253c0c1c2c3c4c5c6c7')
+PLAIN = (b"Ladies and Gentlemen of the class of '99: If I could offer you "
+	b"only one tip for the future, sunscreen would be it.")
+CIPHER = bytes.fromhex(
+	'd31a8d34648e60db7b86afbc53ef7ec2a4aded51296e08fea9e2b5a736ee62d6'
+	'3dbea45e8ca9671282fafb69da92728b1a71de0a9e060b2905d6a5b67ecd3b36'
+	'92ddbd7f2d778b8c9803aee328091b58fab324e4fad675945585808b4831d7bc'
+	'3ff4def08e4b7a9de576d26586cec64b6116')
+TAG = bytes.fromhex('1ae10b594f09e26a7e902ecbd0600691')
+
+
+class TestPoly1305 :
+
+	def test_rfc8439(self) :
+		# 2.5.2
+		mac = Poly1305(bytes.fromhex(
+			'85d6be7857556d337f4452fe42d506a80103808afb0db2fd4abff6af4149f51b'))
+		mac.update(b'Cryptographic Forum ')
+		mac.update(b'Research Group')
+		assert mac.hexdigest() == 'a8061dc1305136c6c22b8baf0c0127a9'
+
+	def test_batches(self, monkeypatch) :
+		key, data = urandom(32), urandom(1000)
+		mac = Poly1305(key)
+		mac.update(data)
+		tag = mac.digest()
+		monkeypatch.setattr(poly1305, 'BATCH', 1) # one reduction per block
+		mac = Poly1305(key)
+		for i in range(0, len(data), 37) :
+			mac.update(data[i:i+37])
+		assert mac.copy().digest() == tag
+		assert mac.digest() == tag
+
+
+class TestAEAD :
+
+	def test_chacha20_poly1305(self) :
+		assert ChaCha20(KEY, NONCE).encrypt_and_digest(PLAIN, AAD) == (CIPHER, TAG)
+		assert ChaCha20(KEY, NONCE).decrypt_and_verify(CIPHER, TAG, AAD) == PLAIN
+
+	def test_xchacha20_poly1305(self) :
+		# draft-irtf-cfrg-xchacha-03, A.3.1
+		cipher = ChaCha20(KEY, bytes(range(0x40, 0x58)))
+		crypttext, tag = cipher.encrypt_and_digest(PLAIN, AAD)
+		assert crypttext.hex() == (
+			'bd6d179d3e83d43b9576579493c0e939572a1700252bfaccbed2902c21396cbb'
+			'731c7f1b0b4aa6440bf3a82f4eda7e39ae64c6708c54c216cb96b72e1213b452'
+			'2f8c9ba40db5d945b11b69b982c1bb9e3f3fac2bc369488f76b2383565d3fff9'
+			'21f9664c97637da9768812f615c68b13b52e')
+		assert tag.hex() == 'c0875924c1c7987947deafd8780acf49'
+		assert cipher.decrypt_and_verify(crypttext, tag, AAD) == PLAIN
+
+	def test_tampered(self) :
+		cipher = ChaCha20(KEY, NONCE)
+		with raises(ValueError) :
+			cipher.decrypt_and_verify(CIPHER[:-1] + b'\0', TAG, AAD)
+		with raises(ValueError) :
+			cipher.decrypt_and_verify(CIPHER, TAG, AAD[1:])
+		with raises(ValueError) :
+			ChaCha20(KEY, bytes(8)).encrypt_and_digest(PLAIN)
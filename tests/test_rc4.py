@@ -0,0 +1,64 @@
+from itertools import islice
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto import base
+from MyCrypto.rc4 import RC4, RC4P
+
+# RFC 6229, key 0102030405, keystream offsets 0 and 16
+KEY = bytes.fromhex('0102030405')
+KEYSTREAM = bytes.fromhex('b2396305f03dc027ccc3524a0a1118a8' '6982944f18fc82d589c403a47a0d0919')
+
+
+class TestRC4 :
+
+	def test_keystream(self) :
+		assert RC4(KEY).keystream_bytes(32) == KEYSTREAM
+		assert RC4(KEY).crypt(bytes(32)) == KEYSTREAM
+
+	def test_drop(self) :
+		# RFC 6229, the same key at offsets 240 and 3072
+		assert RC4(KEY, drop=240).keystream_bytes(16).hex() == '28cb1132c96ce286421dcaadb8b69eae'
+		assert RC4(KEY, drop=3072).keystream_bytes(16).hex() == 'ec0e11c479dc329dc8da7968fe965681'
+		key = urandom(16)
+		assert RC4P(key, drop=100).keystream_bytes(50) == RC4P(key).keystream_bytes(150)[100:]
+
+	def test_pieces(self, monkeypatch) :
+		for cls in (RC4, RC4P) :
+			key, data = urandom(16), urandom(1000)
+			crypttext = cls(key).crypt(data)
+			cipher = cls(key)
+			pieces = (0, 1, 17, 500, 999, 1000)
+			assert b''.join(cipher.crypt(data[i:j]) for i,j in zip(pieces, pieces[1:])) == crypttext
+			assert cls(key).decrypt(crypttext) == data
+
+			cipher, buf = cls(key), bytearray(1000)
+			assert cipher.keystream_into(buf) == 1000
+			assert base._xor(buf, data) == crypttext
+			assert bytes(islice(cls(key).keystream(), 1000)) == buf
+
+			monkeypatch.setattr(base, '_WINDOW', 64)
+			assert cls(key).crypt(data) == crypttext
+			monkeypatch.undo()
+
+	def test_state(self) :
+		for cls in (RC4, RC4P) :
+			key, data = urandom(16), urandom(1000)
+			crypttext = cls(key, drop=10).crypt(data)
+			cipher = cls(key, drop=10)
+			head = cipher.crypt(data[:300])
+			state = cipher.getstate()
+			assert len(state) == 258
+			assert head + cls.from_state(state).crypt(data[300:]) == crypttext
+			cipher.setstate(state)
+			assert cipher.crypt(data[300:]) == crypttext[300:]
+
+		for state in (bytes(258), bytes(range(256)) + b'\0', bytes(range(8)) + b'\0\x08') :
+			with raises(ValueError) :
+				RC4.from_state(state)
+		# too short to hold S, i and j, or not 2^n + 2 bytes
+		for cls in (RC4, RC4P) :
+			for state in (b'', b'\0', b'\0\0', bytes(range(5)), bytes(range(256)) * 2) :
+				with raises(ValueError) :
+					cls.from_state(state)
@@ -0,0 +1,12 @@
+from MyCrypto.sm4 import SM4
+
+
+class TestBlocks :
+
+	def test_sm4(self) :
+		# GM/T 0002-2012, Appendix A.1
+		key = bytes.fromhex('0123456789abcdeffedcba9876543210')
+		crypttext = bytes.fromhex('681edf34d206965e86b3e94f536e4246')
+		sm4 = SM4(key)
+		assert sm4.encrypt_blocks(key*2) == crypttext*2
+		assert sm4.decrypt_block(crypttext) == key
@@ -0,0 +1,65 @@
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto.aes import AES
+from MyCrypto.sm4 import SM4
+from MyCrypto.xts import XTS
+
+
+class TestXTS :
+
+	def test_ieee1619(self) :
+		# IEEE Std 1619-2007, vector 4
+		xts = XTS(AES, bytes.fromhex(
+			'27182818284590452353602874713526'
+			'31415926535897932384626433832795'))
+		plain = bytes(range(256))*2
+		crypttext = xts.encrypt(plain, 0)
+		assert crypttext[:32] == bytes.fromhex(
+			'27a7479befa1d476489f308cd4cfa6e2a96e4bbe3208ff25287dd3819616e89c')
+		assert crypttext[-16:] == bytes.fromhex('0a282df920147beabe421ee5319d0568')
+		assert xts.decrypt(crypttext, 0) == plain
+		
+		# vector 15, ciphertext stealing
+		xts = XTS(AES, bytes.fromhex(
+			'fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0'
+			'bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0'))
+		crypttext = bytes.fromhex('6c1625db4671522d3d7599601de7ca09ed')
+		assert xts.encrypt(bytes(range(17)), 0x123456789a) == crypttext
+		assert xts.decrypt(crypttext, 0x123456789a) == bytes(range(17))
+
+	def test_sectors(self) :
+		# Every sector is crypted on its own
+		data = urandom(4096*3 + 40)
+		for algorithm in (AES, SM4) :
+			xts = XTS(algorithm, urandom(32), 4096)
+			crypttext = xts.encrypt(data, 5)
+			assert crypttext[4096:8192] == xts.encrypt(data[4096:8192], 6)
+			assert crypttext[-40:] == xts.encrypt(data[-40:], 8)
+			assert xts.decrypt(crypttext, 5) == data
+
+	def test_parallel(self, parallel, tmp_path) :
+		data = urandom(512*13 + 100)
+		xts = XTS(SM4, urandom(32))
+		crypttext = xts.encrypt(data, 9)
+		parallel.WORKERS = 1
+		assert xts.encrypt(data, 9) == crypttext
+		
+		path = tmp_path / 'disk.img'
+		path.write_bytes(data)
+		assert xts.encrypt_file(path, 9) == len(data)
+		assert path.read_bytes() == crypttext
+		xts.decrypt_file(path, 9)
+		assert path.read_bytes() == data
+
+	def test_errors(self) :
+		with raises(ValueError) :
+			XTS(AES, bytes(32))
+		with raises(ValueError) :
+			XTS(AES, urandom(32), 100)
+		xts = XTS(AES, urandom(32))
+		with raises(ValueError) :
+			xts.encrypt(bytes(15))
+		with raises(ValueError) :
+			xts.encrypt(bytes(512 + 8))
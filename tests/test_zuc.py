@@ -0,0 +1,96 @@
+from itertools import islice
+from os import urandom
+
+from pytest import raises
+
+from MyCrypto import base
+from MyCrypto.zuc import ZUC, eea3, eia3
+
+# 3GPP, Specification of the 3GPP Confidentiality and Integrity Algorithms
+# 	128-EEA3 & 128-EIA3, Document 3: Implementor's Test Data, ZUC test sets 1-4
+VECTORS = (
+	('00' * 16, '00' * 16, (0x27bede74, 0x018082da)),
+	('ff' * 16, 'ff' * 16, (0x0657cfa0, 0x7096398b)),
+	('3d4c4be96a82fdaeb58f641db17b455b', '84319aa8de6915ca1f6bda6bfbd8c766', (0x14f1c272, 0x3279c419)),
+	('4d320bfad4c285bfd6b8bd00f39d8b41', '52959daba0bf176ece2dc315049eb574', (0xed4400e7, 0x0633e5c5)),
+)
+
+
+class TestZUC :
+
+	def test_vectors(self) :
+		for key, iv, words in VECTORS :
+			assert ZUC(bytes.fromhex(key), bytes.fromhex(iv)).keywords(2) == list(words)
+		# test set 4, z2000
+		key, iv, _ = VECTORS[3]
+		assert ZUC(bytes.fromhex(key), bytes.fromhex(iv)).keywords(2000)[-1] == 0x7a574cdb
+
+	def test_bytes(self) :
+		key, iv = urandom(16), urandom(16)
+		words = ZUC(key, iv).keywords(300)
+		ks = b''.join(w.to_bytes(4, 'big') for w in words)
+		cipher = ZUC(key, iv)
+		pieces = (0, 1, 3, 4, 9, 100, 1200)
+		assert b''.join(cipher.keystream_bytes(j-i) for i,j in zip(pieces, pieces[1:])) == ks
+		assert bytes(islice(ZUC(key, iv).keystream(), 1200)) == ks
+
+		data = urandom(1000)
+		cipher = ZUC(key, iv)
+		assert cipher.crypt(data[:5]) + cipher.crypt(data[5:999]) == base._xor(data[:999], ks[:999])
+		with raises(ValueError) :
+			cipher.keywords(1)
+
+	def test_errors(self) :
+		with raises(ValueError) :
+			ZUC(bytes(15))
+		with raises(ValueError) :
+			ZUC(bytes(16), bytes(8))
+
+
+def _eia3_bitwise(key, count, bearer, direction, data, length) :
+	# the specification as written: one keystream word per message bit
+	iv = bytearray(16)
+	iv[0:4] = count.to_bytes(4, 'big')
+	iv[4] = bearer << 3
+	iv[8:16] = iv[0:8]
+	iv[8] ^= direction << 7
+	iv[14] ^= direction << 7
+	n = (length + 31 >> 5) + 2
+	z = ''.join(format(w, '032b') for w in ZUC(key, bytes(iv)).keywords(n))
+	word = lambda i : int(z[i:i+32], 2)
+	bits = ''.join(format(b, '08b') for b in data)
+	t = 0
+	for i in range(length) :
+		if bits[i] == '1' :
+			t ^= word(i)
+	t ^= word(length)
+	return (t ^ word(32 * (n - 1))).to_bytes(4, 'big')
+
+
+class TestEEA3EIA3 :
+
+	def test_eea3(self) :
+		# 128-EEA3 test set 1
+		key = bytes.fromhex('173d14ba5003731d7a60049470f00a29')
+		plain = bytes.fromhex('6cf65340735552ab0c9752fa6f9025fe0bd675d9005875b200000000')
+		crypt = bytes.fromhex('a6c85fc66afb8533aafc2518dfe784940ee1e4b030238cc8')
+		out = eea3(key, 0x66035492, 0xf, 0, plain, 193)
+		assert out == crypt + b'\0'
+		assert eea3(key, 0x66035492, 0xf, 0, out, 193) == plain[:25]
+		# whole bytes by default, and the same as the ZUC keystream with its iv
+		data = urandom(100)
+		iv = bytes.fromhex('66035492') + bytes((0xf << 3 | 1 << 2, 0, 0, 0))
+		assert eea3(key, 0x66035492, 0xf, 1, data) == ZUC(key, iv * 2).crypt(data)
+
+	def test_eia3(self) :
+		# 128-EIA3 test sets 1, 2
+		assert eia3(bytes(16), 0, 0, 0, bytes(4), 1).hex() == 'c8a9595e'
+		key = bytes.fromhex('47054125561eb2dda94059da05097850')
+		assert eia3(key, 0x561eb2dd, 0x14, 0, bytes(12), 90).hex() == '6719a088'
+		for length in (0, 1, 31, 32, 33, 250, 1000) :
+			key, data = urandom(16), urandom(length + 7 >> 3)
+			for direction in (0, 1) :
+				assert eia3(key, 0x1234abcd, 0x11, direction, data, length) == \
+					_eia3_bitwise(key, 0x1234abcd, 0x11, direction, data, length)
+		with raises(ValueError) :
+			eia3(key, 0, 0, 0, bytes(4), 33)